@@ -78,6 +78,9 @@ setup(
         'dev': [
             'pip-tools',
         ],
+        'dask': [
+            'dask[array]',
+        ],
         'dcimg': [
             'dcimg>=0.4.0'
         ],
@@ -87,6 +90,9 @@ setup(
             'sphinx_rtd_theme',
         ],
         'test': ['mock'],
+        'zarr': [
+            'zarr',
+        ],
     },
 
     # If there are data files included in your packages that need to be
@@ -102,6 +108,7 @@ setup(
         'console_scripts': [
             'stitch-align = zetastitcher.runner:main',
             'stitch-fuse = zetastitcher.fuser.__main__:main',
+            'stitch-overview = zetastitcher.fuser.overview:main',
         ],
 
     },
@@ -0,0 +1,108 @@
+"""Synthetic mosaics for the tests.
+
+Tiles are cropped from a random volume at known positions, so that the
+fused volume must match it wherever it is covered by at least one tile
+(blending weights of identical values sum to the value itself).
+"""
+
+import io
+import os
+import zipfile
+
+import numpy as np
+import yaml
+import imageio
+
+import skimage.external.tifffile as tiff
+
+
+def make_mosaic(path, ny=2, nx=3, tile_shape=(12, 40, 50), overlap=(8, 10),
+                fmt='tiff', nchannels=1, dtype=np.uint16, seed=0):
+    """Write a `ny` x `nx` mosaic of tiles and a stitch.yml file with their
+    absolute positions.
+
+    Parameters
+    ----------
+    path : str
+        Output directory.
+    ny, nx : int
+        Number of tiles along Y and X.
+    tile_shape : tuple
+        Shape (Z, Y, X) of each tile.
+    overlap : tuple
+        Nominal overlap (Y, X) between adjacent tiles, in pixels.
+    fmt : str
+        One of 'tiff', 'zip' (one PNG per frame), 'zarr'.
+    nchannels : int
+    dtype
+    seed : int
+
+    Returns
+    -------
+    tuple
+        Path of the .yml file and the reference volume (ZYX, or ZCYX for
+        multichannel mosaics), zero where no tile is present.
+    """
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+
+    nz, ty, tx = tile_shape
+    tiles = []
+    for j in range(ny):
+        for i in range(nx):
+            # small shifts with respect to the nominal grid
+            Xs = i * (tx - overlap[1]) + j % 2 * 2
+            Ys = j * (ty - overlap[0]) + i % 2
+            Zs = (i + j) % 2 * 2
+            tiles.append((i, j, Zs, Ys, Xs))
+
+    shape = [max(t[2] for t in tiles) + nz, max(t[3] for t in tiles) + ty,
+             max(t[4] for t in tiles) + tx]
+    if nchannels > 1:
+        shape.append(nchannels)
+    volume = rng.integers(100, 4000, size=shape).astype(dtype)
+
+    covered = np.zeros(shape[:3], dtype=bool)
+    ext = {'tiff': 'tif', 'zip': 'zip', 'zarr': 'zarr'}[fmt]
+    entries = []
+    for i, j, Zs, Ys, Xs in tiles:
+        covered[Zs:Zs + nz, Ys:Ys + ty, Xs:Xs + tx] = True
+        data = volume[Zs:Zs + nz, Ys:Ys + ty, Xs:Xs + tx]
+
+        name = 'x_{:06d}_y_{:06d}_z_000000.{}'.format(i * 100, j * 100, ext)
+        write_stack(os.path.join(path, name), data, fmt)
+
+        entries.append(dict(X=i * 100, Y=j * 100, Z=0, nfrms=nz, ysize=ty,
+                            xsize=tx, Xs=Xs, Ys=Ys, Zs=Zs, filename=name))
+
+    volume[~covered] = 0
+    if nchannels > 1:
+        volume = np.moveaxis(volume, -1, 1)
+
+    yml = os.path.join(path, 'stitch.yml')
+    with open(yml, 'w') as f:
+        yaml.dump({'filematrix': entries}, f, default_flow_style=False)
+
+    return yml, volume
+
+
+def write_stack(file_name, data, fmt='tiff'):
+    """Write a stack of frames (ZYX or ZYXC) in the given format."""
+    if fmt == 'tiff':
+        if data.ndim > 3:
+            tiff.imsave(file_name, data, photometric='rgb')
+        else:
+            tiff.imsave(file_name, data, photometric='minisblack')
+    elif fmt == 'zip':
+        with zipfile.ZipFile(file_name, 'w') as zf:
+            for k, frame in enumerate(data):
+                b = io.BytesIO()
+                imageio.imwrite(b, frame, format='png')
+                zf.writestr('{:04d}.png'.format(k), b.getvalue())
+    elif fmt == 'zarr':
+        import zarr
+        a = zarr.open_array(file_name, mode='w', shape=data.shape,
+                            chunks=(4,) + data.shape[1:], dtype=data.dtype)
+        a[:] = data
+    else:
+        raise ValueError('unknown format {}'.format(fmt))
@@ -0,0 +1,115 @@
+import asyncio
+import shutil
+import tempfile
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import numpy as np
+
+from zetastitcher.io.virtual_fused_volume import VirtualFusedVolume
+
+from .mosaic import make_mosaic
+
+
+class TestGetRegion(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.yml, self.volume = make_mosaic(self.dir)
+        self.vfv = VirtualFusedVolume(self.yml)
+        self.vfv.n_of_threads = 1
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+        self.vfv.close()
+        shutil.rmtree(self.dir)
+
+    def blocking_tile_region(self):
+        """Make tile reads wait for `release`, setting `started` when the
+        first one begins."""
+        started = threading.Event()
+        release = threading.Event()
+        tile_region = self.vfv._tile_region
+
+        def side_effect(*args):
+            started.set()
+            release.wait(10)
+            return tile_region(*args)
+
+        m = mock.patch.object(self.vfv, '_tile_region',
+                              side_effect=side_effect)
+        return m, started, release
+
+    def test_get_region(self):
+        item = np.index_exp[3:9, 10:60, ::-3]
+
+        async def query():
+            return await self.vfv.get_region(item, self.executor)
+
+        a = asyncio.run(query())
+        np.testing.assert_array_equal(a, self.volume[item])
+        self.assertFalse(a.flags.writeable)
+        self.assertEqual(self.vfv._pending, {})
+
+    def test_shared(self):
+        item = np.index_exp[5, 10:60]
+
+        async def query():
+            return await asyncio.gather(
+                self.vfv.get_region(item, self.executor),
+                self.vfv.get_region(np.index_exp[5, 10:60, :],
+                                    self.executor),
+                self.vfv.get_region(np.index_exp[6, 10:60], self.executor))
+
+        with mock.patch.object(self.vfv, '_get_shared',
+                               wraps=self.vfv._get_shared) as m:
+            a, b, c = asyncio.run(query())
+        self.assertEqual(m.call_count, 2)
+        self.assertIs(a, b)
+        np.testing.assert_array_equal(a, self.volume[item])
+        np.testing.assert_array_equal(c, self.volume[6, 10:60])
+
+    def test_cancel(self):
+        patcher, started, release = self.blocking_tile_region()
+
+        async def query():
+            loop = asyncio.get_running_loop()
+            task = asyncio.ensure_future(
+                self.vfv.get_region(np.index_exp[...], self.executor))
+            await loop.run_in_executor(None, started.wait, 10)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with patcher as m:
+            asyncio.run(query())
+            release.set()
+            self.executor.shutdown()
+        # the computation stopped after the tile being read
+        self.assertEqual(m.call_count, 1)
+        self.assertEqual(self.vfv._pending, {})
+
+    def test_cancel_one_waiter(self):
+        patcher, started, release = self.blocking_tile_region()
+        item = np.index_exp[2:4]
+
+        async def query():
+            loop = asyncio.get_running_loop()
+            t1 = asyncio.ensure_future(
+                self.vfv.get_region(item, self.executor))
+            t2 = asyncio.ensure_future(
+                self.vfv.get_region(item, self.executor))
+            await loop.run_in_executor(None, started.wait, 10)
+            t1.cancel()
+            await asyncio.sleep(0)
+            release.set()
+            with self.assertRaises(asyncio.CancelledError):
+                await t1
+            return await t2
+
+        with patcher:
+            a = asyncio.run(query())
+        np.testing.assert_array_equal(a, self.volume[item])
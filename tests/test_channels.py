@@ -0,0 +1,63 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from zetastitcher.io.inputfile import InputFile
+from zetastitcher.io.utils import reduce_channels, reduced_dtype, \
+    reduced_shape
+
+from .mosaic import write_stack
+
+
+class TestReduceChannels(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.a = rng.integers(0, 255, (4, 5, 6, 3)).astype(np.uint8)
+
+    def test_select(self):
+        np.testing.assert_array_equal(reduce_channels(self.a, 1),
+                                      self.a[..., 1])
+        np.testing.assert_array_equal(reduce_channels(self.a, -1), self.a)
+
+    def test_sum(self):
+        s = reduce_channels(self.a, -2)
+        np.testing.assert_array_equal(s, self.a.sum(axis=-1))
+        self.assertEqual(s.dtype, reduced_dtype(self.a.dtype, -2))
+
+    def test_dtype_and_out(self):
+        out = np.empty(reduced_shape(self.a.shape, 2), dtype=np.float32)
+        ret = reduce_channels(self.a, 2, np.float32, out=out)
+        self.assertIs(ret, out)
+        np.testing.assert_array_equal(out, self.a[..., 2])
+
+
+class TestInputFileChannels(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 255, (5, 20, 30, 3)).astype(np.uint8)
+        self.fname = os.path.join(self.dir, 'rgb.tif')
+        write_stack(self.fname, self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_channels(self):
+        with InputFile(self.fname) as f:
+            self.assertEqual(f.nchannels, 3)
+            self.assertEqual(f.shape, (5, 3, 20, 30))
+            np.testing.assert_array_equal(
+                f.zslice(0, 5), np.moveaxis(self.data, -1, 1))
+
+            f.channel = 1
+            self.assertEqual(f.shape, (5, 20, 30))
+            np.testing.assert_array_equal(f.zslice(1, 4),
+                                          self.data[1:4, ..., 1])
+
+            f.channel = -2
+            np.testing.assert_array_equal(
+                f.zslice(0, 5, dtype=np.float32),
+                self.data.sum(axis=-1).astype(np.float32))
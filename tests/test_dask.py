@@ -0,0 +1,64 @@
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+try:
+    import dask
+    import dask.array as da
+except ImportError:
+    dask = None
+
+from zetastitcher.io.virtual_fused_volume import VirtualFusedVolume
+
+from .mosaic import make_mosaic
+
+
+@unittest.skipUnless(dask, 'requires dask')
+class TestToDask(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.yml, self.volume = make_mosaic(self.dir)
+        self.vfv = VirtualFusedVolume(self.yml)
+
+    def tearDown(self):
+        self.vfv.close()
+        shutil.rmtree(self.dir)
+
+    def test_lazy(self):
+        with mock.patch.object(self.vfv, '_fuse', wraps=self.vfv._fuse) as m:
+            d = self.vfv.to_dask(chunks=(4, 32, 64))
+            self.assertIsInstance(d, da.Array)
+            self.assertEqual(d.shape, self.volume.shape)
+            self.assertEqual(d.dtype, self.volume.dtype)
+            m.assert_not_called()
+
+            with dask.config.set(scheduler='threads'):
+                a = d.compute()
+            self.assertEqual(m.call_count, d.npartitions)
+        np.testing.assert_array_equal(a, self.volume)
+
+    def test_default_chunks(self):
+        self.vfv.chunk_shape = (5, 30, 100)
+        d = self.vfv.to_dask()
+        self.assertEqual(d.chunks, ((5, 5, 4), (30, 30, 13), (100, 32)))
+
+    def test_reductions(self):
+        d = self.vfv.to_dask(chunks=(3, 40, 40))
+        with dask.config.set(scheduler='threads'):
+            np.testing.assert_array_equal(d.max(axis=0).compute(),
+                                          self.volume.max(axis=0))
+            np.testing.assert_array_equal(d[2:9, 10:20].compute(),
+                                          self.volume[2:9, 10:20])
+
+    def test_multichannel(self):
+        yml, volume = make_mosaic(self.dir, nchannels=3, dtype=np.uint8)
+        with VirtualFusedVolume(yml) as vfv:
+            d = vfv.to_dask()
+            self.assertEqual(d.shape, volume.shape)
+            self.assertEqual(d.chunks[1], (3,))
+            np.testing.assert_array_equal(d.compute(scheduler='threads'),
+                                          volume)
@@ -0,0 +1,104 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from zetastitcher.io.inputfile import InputFile
+from zetastitcher.io.filematrix import FileMatrix, METADATA_CACHE_FILE_NAME
+
+from .mosaic import make_mosaic
+
+
+class TestLoadDir(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        make_mosaic(self.dir)
+        os.remove(os.path.join(self.dir, 'stitch.yml'))
+        self.cache_file = os.path.join(self.dir, METADATA_CACHE_FILE_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_probe(self):
+        for n in [1, 4]:
+            fm = FileMatrix(self.dir, n_of_threads=n, use_metadata_cache=False)
+            df = fm.data_frame
+            self.assertEqual(len(df), 6)
+            self.assertEqual((fm.Ny, fm.Nx), (2, 3))
+            self.assertTrue((df['nfrms'] == 12).all())
+            self.assertTrue((df['ysize'] == 40).all())
+            self.assertTrue((df['xsize'] == 50).all())
+            self.assertFalse(os.path.exists(self.cache_file))
+
+    def test_cache(self):
+        FileMatrix(self.dir)
+        with open(self.cache_file) as f:
+            cache = json.load(f)
+        self.assertEqual(len(cache), 6)
+
+        # cached entries are used without opening the files
+        with mock.patch('zetastitcher.io.filematrix.InputFile') as m:
+            fm = FileMatrix(self.dir)
+            m.assert_not_called()
+        self.assertEqual(len(fm.data_frame), 6)
+
+    def test_cache_pruned(self):
+        FileMatrix(self.dir)
+
+        # rename a tile: the old entry must be dropped
+        old = 'x_000000_y_000000_z_000000.tif'
+        new = 'x_000000_y_000000_z_000001.tif'
+        os.rename(os.path.join(self.dir, old), os.path.join(self.dir, new))
+        FileMatrix(self.dir)
+
+        with open(self.cache_file) as f:
+            cache = json.load(f)
+        self.assertNotIn(old, cache)
+        self.assertIn(new, cache)
+        self.assertEqual(len(cache), 6)
+
+    def test_cache_not_writable(self):
+        with mock.patch('zetastitcher.io.filematrix.open',
+                        side_effect=OSError, create=True):
+            fm = FileMatrix(self.dir)
+        self.assertEqual(len(fm.data_frame), 6)
+
+
+class TestTileMetadata(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_probed(self):
+        make_mosaic(self.dir, nchannels=3, dtype=np.uint8)
+        os.remove(os.path.join(self.dir, 'stitch.yml'))
+        fm = FileMatrix(self.dir, use_metadata_cache=False)
+        with mock.patch('zetastitcher.io.filematrix.InputFile') as m:
+            self.assertEqual(fm.tile_metadata(), (np.dtype(np.uint8), 3))
+            m.assert_not_called()
+
+    def test_old_yml(self):
+        # .yml files without dtype and nchannels: the first tile is probed
+        # once
+        yml, _ = make_mosaic(self.dir, dtype=np.uint16)
+        fm = FileMatrix(yml)
+        self.assertNotIn('dtype', fm.data_frame.columns)
+        with mock.patch('zetastitcher.io.filematrix.InputFile',
+                        wraps=InputFile) as m:
+            self.assertEqual(fm.tile_metadata(), (np.dtype(np.uint16), 1))
+            self.assertEqual(fm.tile_metadata(), (np.dtype(np.uint16), 1))
+        self.assertEqual(m.call_count, 1)
+
+        # saved along with the positions
+        fm.save_to_yaml(yml, 'update')
+        with mock.patch('zetastitcher.io.filematrix.InputFile') as m:
+            self.assertEqual(FileMatrix(yml).tile_metadata(),
+                             (np.dtype(np.uint16), 1))
+            m.assert_not_called()
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from zetastitcher.fuser.fuse import overlap_regions, z_intervals
+from zetastitcher.fuser.fuse import OverlapAccumulator
+from zetastitcher.io.inputfile import InputFile
+from zetastitcher.io.filematrix import FileMatrix
+from zetastitcher.io.virtual_fused_volume import VirtualFusedVolume
+from zetastitcher.fuser.fuse_runner import FuseRunner
+
+from .mosaic import make_mosaic
+
+
+def region_mask(frame_shape, regions):
+    mask = np.zeros(frame_shape, dtype=int)
+    for y0, y1, x0, x1 in regions:
+        mask[y0:y1, x0:x1] += 1
+    return mask
+
+
+class TestOverlapRegions(unittest.TestCase):
+    def test_partition(self):
+        shape = (40, 50)
+        for rects in [(),
+                      ((0, 40, 40, 50),),
+                      ((0, 8, 0, 50), (0, 40, 40, 50), (0, 8, 40, 50)),
+                      ((32, 40, 0, 50), (0, 40, 0, 10), (-3, 12, 45, 60))]:
+            inside, outside = overlap_regions(shape, rects)
+
+            union = np.zeros(shape, dtype=bool)
+            for y0, y1, x0, x1 in rects:
+                union[max(y0, 0):y1, max(x0, 0):x1] = True
+
+            # disjoint regions, covering the union of the rects and the rest
+            # of the frame respectively
+            m_in = region_mask(shape, inside)
+            m_out = region_mask(shape, outside)
+            np.testing.assert_array_equal(m_in + m_out, 1)
+            np.testing.assert_array_equal(m_in.astype(bool), union)
+
+    def test_z_intervals(self):
+        overlaps = np.array([(2, 5), (0, 12), (4, 20)],
+                            dtype=[('Z_from', int), ('Z_to', int)])
+        self.assertEqual(z_intervals(overlaps, 12),
+                         [(0, 2), (2, 4), (4, 5), (5, 12)])
+        self.assertEqual(z_intervals(overlaps[:0], 12), [(0, 12)])
+
+
+class TestOverlapAccumulator(unittest.TestCase):
+    def test_accumulate(self):
+        dest = np.zeros((4, 10, 12), dtype=np.uint16)
+        boxes = [[0, 4, 0, 6, 0, 8], [1, 4, 4, 10, 5, 12]]
+        acc = OverlapAccumulator(dest, boxes)
+        # only the region shared by the two tiles is buffered in float
+        self.assertEqual(len(acc.cells), 1)
+        buf, = acc.cells.values()
+        self.assertEqual(buf.shape, (3, 2, 3))
+        self.assertEqual(buf.dtype, np.float32)
+
+        expected = np.zeros(dest.shape)
+        for (z0, z1, y0, y1, x0, x1), value in zip(boxes, [100.3, 200.4]):
+            index = np.index_exp[z0:z1, y0:y1, x0:x1]
+            data = np.full((z1 - z0, y1 - y0, x1 - x0), value, np.float32)
+            acc.add(index, data)
+            expected[index] += value
+        acc.flush()
+        np.testing.assert_array_equal(dest, np.rint(expected))
+
+    def test_multichannel(self):
+        dest = np.zeros((2, 3, 6, 6), dtype=np.uint8)
+        boxes = [[0, 2, 0, 6, 0, 4], [0, 2, 0, 6, 2, 6]]
+        acc = OverlapAccumulator(dest, boxes)
+        acc.add(np.index_exp[0:2, ..., 0:6, 0:4],
+                np.full((2, 3, 6, 4), 1.25, np.float32))
+        acc.add(np.index_exp[0:2, ..., 0:6, 2:6],
+                np.full((2, 3, 6, 4), 1.5, np.float32))
+        acc.flush()
+        np.testing.assert_array_equal(dest[..., :2], 1)
+        np.testing.assert_array_equal(dest[..., 2:4], 3)
+        np.testing.assert_array_equal(dest[..., 4:], 2)
+
+
+class TestFusedEdges(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_edges(self):
+        # tile edge pixels must keep their value, also when they are not
+        # covered by any overlap
+        yml, volume = make_mosaic(self.dir, ny=1, nx=2, overlap=(0, 10))
+        with VirtualFusedVolume(yml) as vfv:
+            a = vfv[...]
+        np.testing.assert_array_equal(a, volume)
+        for sl in [np.index_exp[:, 0], np.index_exp[:, -1],
+                   np.index_exp[..., 0], np.index_exp[..., -1]]:
+            self.assertTrue(np.all(a[sl][volume[sl] > 0] > 0))
+
+    def test_strided(self):
+        yml, volume = make_mosaic(self.dir)
+        with VirtualFusedVolume(yml) as vfv:
+            for item in [np.index_exp[::3, 5:70:4, ::7],
+                         np.index_exp[1:13:5, ::-2, 3:100:9]]:
+                np.testing.assert_array_equal(vfv[item], volume[item])
+
+
+class TestDebugOverlay(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        # tiles too small for tile numbers: only edges are drawn
+        self.yml, self.volume = make_mosaic(self.dir, dtype=np.float32)
+
+        self.edges = np.zeros(self.volume.shape, dtype=bool)
+        for row in FileMatrix(self.yml).data_frame.itertuples():
+            z = np.s_[row.Zs:row.Zs_end]
+            self.edges[z, row.Ys_end - 2:row.Ys_end, row.Xs:row.Xs_end] = True
+            self.edges[z, row.Ys:row.Ys_end, row.Xs_end - 2:row.Xs_end] = True
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def check_edges(self, a, edges):
+        # edges are marked after weighting, then other tiles are added
+        self.assertTrue(np.all(a[edges] >= 65000))
+        self.assertTrue(np.all(a[~edges] < 65000))
+
+    def test_virtual_fused_volume(self):
+        with VirtualFusedVolume(self.yml) as vfv:
+            vfv.overlay_debug_enabled = True
+            # only tile edges are marked, not the borders of the query
+            for item in [np.index_exp[...], np.index_exp[3:9, 10:60, 5:90],
+                         np.index_exp[::2, 1::3, ::-4], np.index_exp[7]]:
+                self.check_edges(vfv[item], self.edges[item])
+
+    def test_fuse_runner(self):
+        out = os.path.join(self.dir, 'fused.tif')
+        for block_shape in [None, (None, 30, 40)]:
+            fr = FuseRunner(FileMatrix(self.yml))
+            fr.output_filename = out
+            fr.debug = True
+            fr.n_of_threads = 2
+            fr.block_shape = block_shape
+            fr.run()
+            with InputFile(out) as f:
+                self.check_edges(f.whole(), self.edges)
@@ -0,0 +1,151 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+import skimage.external.tifffile as tiff
+
+from zetastitcher.io.inputfile import InputFile
+from zetastitcher.io.filematrix import FileMatrix
+from zetastitcher.fuser.overlaps import Overlaps
+from zetastitcher.fuser.fuse import OverlapAccumulator
+from zetastitcher.fuser.fuse_runner import FuseRunner
+
+from .mosaic import make_mosaic
+
+
+class FuseRunnerTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.yml, self.volume = make_mosaic(self.dir)
+        self.out = os.path.join(self.dir, 'fused.tif')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def fuse(self, **kwargs):
+        fr = FuseRunner(FileMatrix(self.yml))
+        fr.output_filename = self.out
+        for k, v in kwargs.items():
+            setattr(fr, k, v)
+        fr.run()
+        with InputFile(self.out) as f:
+            return f.whole()
+
+    def n_of_pages(self):
+        with tiff.TiffFile(self.out) as t:
+            return len(t.pages)
+
+
+class TestStreaming(FuseRunnerTestCase):
+    def test_one_page_per_frame(self):
+        # blocks of 3 and 4 frames must not be written as RGB(A) pages
+        for nz in [3, 4]:
+            a = self.fuse(n_of_threads=2, block_shape=(nz, None, None))
+            self.assertEqual(self.n_of_pages(), self.volume.shape[0])
+            np.testing.assert_array_equal(a, self.volume)
+
+    def test_max_memory(self):
+        frame = self.volume[0].nbytes
+        a = self.fuse(max_memory=12 * frame, n_of_threads=2)
+        self.assertEqual(self.n_of_pages(), self.volume.shape[0])
+        np.testing.assert_array_equal(a, self.volume)
+
+
+class TestParallelBlocks(FuseRunnerTestCase):
+    def test_fuse(self):
+        np.testing.assert_array_equal(self.fuse(), self.volume)
+
+    def test_threads_and_blocks(self):
+        for kwargs in [dict(n_of_threads=4),
+                       dict(n_of_threads=3, block_shape=(None, 30, 40)),
+                       dict(n_of_threads=2, block_shape=(5, None, 64))]:
+            np.testing.assert_array_equal(self.fuse(**kwargs), self.volume)
+
+    def test_z_range(self):
+        a = self.fuse(n_of_threads=4, zmin=3, zmax=11)
+        np.testing.assert_array_equal(a, self.volume[3:11])
+
+
+class TestFusedDtype(FuseRunnerTestCase):
+    def test_fused_dtype(self):
+        fr = FuseRunner(FileMatrix(self.yml))
+        self.assertEqual(fr.fused_dtype, np.uint16)
+        fr.debug = True
+        self.assertEqual(fr.fused_dtype, np.float32)
+
+    def test_float_tiles(self):
+        self.yml, self.volume = make_mosaic(self.dir, dtype=np.float32)
+        fr = FuseRunner(FileMatrix(self.yml))
+        self.assertEqual(fr.fused_dtype, np.float32)
+
+        a = self.fuse(n_of_threads=2)
+        self.assertEqual(a.dtype, np.float32)
+        np.testing.assert_allclose(a, self.volume, rtol=1e-5)
+
+    def test_integer_output(self):
+        a = self.fuse(n_of_threads=2)
+        self.assertEqual(a.dtype, np.uint16)
+        np.testing.assert_array_equal(a, self.volume)
+
+
+    def test_budget_with_accumulators(self):
+        fr = FuseRunner(FileMatrix(self.yml))
+        ov = Overlaps(fr.fm)
+        frame = self.volume[0].nbytes
+        fr.max_memory = 40 * frame
+        n_frames = fr._frames_in_budget(ov)
+        with mock.patch.object(FuseRunner, '_overlap_fraction',
+                               return_value=0):
+            self.assertLess(n_frames, fr._frames_in_budget(ov))
+
+        # the float32 buffers of the accumulators fit in the estimate
+        cells = []
+
+        def accumulator(dest, boxes):
+            acc = OverlapAccumulator(dest, boxes)
+            cells.extend(acc.cells.values())
+            return acc
+
+        with mock.patch('zetastitcher.fuser.fuse_runner.OverlapAccumulator',
+                        side_effect=accumulator):
+            a = self.fuse(n_of_threads=2, block_shape=(None, 30, 40))
+        estimate = self.volume.size * fr._overlap_fraction(ov) * 4
+        self.assertGreater(len(cells), 0)
+        self.assertLessEqual(sum(c.nbytes for c in cells), estimate)
+        np.testing.assert_array_equal(a, self.volume)
+
+
+class TestChunks(FuseRunnerTestCase):
+    def test_tiles_opened_once(self):
+        frame = self.volume[0].nbytes
+        with mock.patch('zetastitcher.io.inputfilepool.InputFile',
+                        wraps=InputFile) as m_open, \
+                mock.patch('zetastitcher.fuser.fuse_runner.Overlaps',
+                           wraps=Overlaps) as m_ov:
+            # several output chunks
+            a = self.fuse(max_memory=8 * frame, n_of_threads=1)
+        self.assertEqual(m_open.call_count, 6)
+        self.assertEqual(m_ov.call_count, 1)
+        np.testing.assert_array_equal(a, self.volume)
+
+    def test_many_tiles(self):
+        # more tiles than the default size of InputFilePool
+        self.yml, self.volume = make_mosaic(
+            self.dir, ny=8, nx=9, tile_shape=(6, 20, 24), overlap=(4, 4))
+        frame = self.volume[0].nbytes
+        for max_open_files, n_of_opens in [(None, 72), (10, None)]:
+            with mock.patch('zetastitcher.io.inputfilepool.InputFile',
+                            wraps=InputFile) as m_open:
+                a = self.fuse(max_memory=4 * frame, n_of_threads=1,
+                              max_open_files=max_open_files)
+            if n_of_opens is None:
+                # tiles are reopened at every chunk
+                self.assertGreater(m_open.call_count, 72)
+            else:
+                self.assertEqual(m_open.call_count, n_of_opens)
+            np.testing.assert_array_equal(a, self.volume)
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from zetastitcher.io.inputfile import InputFile
+
+
+class FakeWrapper(object):
+    """An in-memory stack counting the frames decoded by :meth:`zslice`."""
+    def __init__(self, data, random_access=True):
+        self.data = data
+        self.random_access = random_access
+        self.nfrms, self.ysize, self.xsize = data.shape
+        self.nchannels = 1
+        self.dtype = data.dtype
+
+        self.n_of_calls = 0
+        self.n_of_decoded = 0
+
+    def zslice(self, start_frame, end_frame=None, dtype=None, copy=True):
+        if end_frame is None:
+            end_frame = start_frame + 1
+        self.n_of_calls += 1
+        # sequential readers decode all the frames before the requested ones
+        self.n_of_decoded += end_frame if not self.random_access \
+            else end_frame - start_frame
+        return self.data[start_frame:end_frame].copy()
+
+
+class TestStridedGetitem(unittest.TestCase):
+    def setUp(self):
+        self.data = np.arange(40 * 6 * 7, dtype=np.uint16).reshape(40, 6, 7)
+
+    def open(self, **kwargs):
+        f = InputFile()
+        f.file = FakeWrapper(self.data, **kwargs)
+        return f
+
+    def test_values(self):
+        items = [np.index_exp[::3], np.index_exp[1:30:4, 2:5],
+                 np.index_exp[::-5, :, ::2], np.index_exp[35:2:-7, 1],
+                 np.index_exp[5:6:3], np.index_exp[7]]
+        for random_access in [True, False]:
+            f = self.open(random_access=random_access)
+            for item in items:
+                np.testing.assert_array_equal(
+                    f[item], np.squeeze(self.data[item]))
+
+    def test_random_access(self):
+        # only the requested frames are decoded
+        f = self.open(random_access=True)
+        f[2:38:4]
+        self.assertEqual(f.file.n_of_calls, 9)
+        self.assertEqual(f.file.n_of_decoded, 9)
+
+    def test_sequential(self):
+        # the covering range is decoded once
+        f = self.open(random_access=False)
+        f[2:38:4]
+        self.assertEqual(f.file.n_of_calls, 1)
+        self.assertEqual(f.file.n_of_decoded, 35)
+
+        f = self.open(random_access=False)
+        f[::-4]
+        self.assertEqual(f.file.n_of_calls, 1)
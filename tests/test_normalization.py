@@ -0,0 +1,70 @@
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from zetastitcher.fuser import fuse
+from zetastitcher.fuser.fuse import ByteBoundedCache, normalization_factor
+
+
+class TestByteBoundedCache(unittest.TestCase):
+    def test_eviction(self):
+        c = ByteBoundedCache(max_bytes=3 * 800)
+        for i in range(3):
+            c.put(i, np.zeros(100))
+        self.assertEqual(c.nbytes, 2400)
+
+        c.get(0)  # 1 is now the least recently used
+        c.put(3, np.zeros(100))
+        self.assertIsNone(c.get(1))
+        for i in [0, 2, 3]:
+            self.assertIsNotNone(c.get(i))
+        self.assertEqual(c.nbytes, 2400)
+
+        c.put(4, np.zeros(200))
+        self.assertEqual(len(c), 2)
+        self.assertLessEqual(c.nbytes, c.max_bytes)
+
+    def test_too_large(self):
+        c = ByteBoundedCache(max_bytes=100)
+        c.put(0, np.zeros(100))
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.nbytes, 0)
+
+    def test_clear(self):
+        c = ByteBoundedCache(max_bytes=1000)
+        c.put(0, np.zeros(10))
+        c.clear()
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.nbytes, 0)
+
+
+class TestNormalizationFactor(unittest.TestCase):
+    def setUp(self):
+        self.cache = ByteBoundedCache(fuse.NORMALIZATION_CACHE_SIZE)
+        patcher = mock.patch.object(fuse, '_normalization_cache', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cached(self):
+        rects = ((0, 20, 40, 50),)
+        a = normalization_factor((20, 50), rects)
+        self.assertEqual(a.dtype, np.float32)
+        self.assertFalse(a.flags.writeable)
+        self.assertIs(normalization_factor((20, 50), rects), a)
+        self.assertEqual(self.cache.nbytes, a.nbytes)
+
+    def test_bounded(self):
+        self.cache.max_bytes = 3 * 20 * 50 * 4
+        for x in range(10):
+            normalization_factor((20, 50), ((0, 20, 40 - x, 50),))
+        self.assertEqual(len(self.cache), 3)
+        self.assertLessEqual(self.cache.nbytes, self.cache.max_bytes)
+
+    def test_values(self):
+        # two tiles overlapping along X: weights sum to 1 within the overlap
+        a = normalization_factor((20, 50), ((0, 20, 40, 50),))
+        b = normalization_factor((20, 50), ((0, 20, 0, 10),))
+        np.testing.assert_allclose(a[:, 40:] + b[:, :10], 1, rtol=1e-6)
+        np.testing.assert_array_equal(a[1:-1, 1:40], 1)
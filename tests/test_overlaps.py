@@ -0,0 +1,114 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from zetastitcher.io.filematrix import FileMatrix
+from zetastitcher.fuser.overlaps import Overlaps, DIRECTIONS, OFFSETS
+from zetastitcher.fuser.overlaps import COLUMNS, OVERLAP_DTYPE, in_z_range
+
+from .mosaic import make_mosaic
+
+
+def brute_force_overlap(fm, name, other_name):
+    """Overlap of tile `name` with tile `other_name`, in tile coordinates,
+    or zeros if they do not overlap."""
+    df = fm.data_frame
+    row = df.loc[name]
+    other = df.loc[other_name]
+
+    ov = []
+    for c in ['Z', 'Y', 'X']:
+        start = row[c + 's']
+        ov.append(max(other[c + 's'], row[c + 's']) - start)
+        ov.append(min(other[c + 's_end'], row[c + 's_end']) - start)
+    if any(ov[k] > ov[k + 1] for k in [0, 2, 4]):
+        return [0] * 6
+    return ov
+
+
+class OverlapsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+
+class TestOverlaps(OverlapsTestCase):
+    def test_brute_force(self):
+        for ny, nx, overlap in [(2, 3, (8, 10)), (3, 3, (8, 10)),
+                                (1, 4, (0, 10)), (3, 2, (-2, 10))]:
+            yml, _ = make_mosaic(self.dir, ny=ny, nx=nx, overlap=overlap)
+            fm = FileMatrix(yml)
+            ov = Overlaps(fm)
+            self.assertEqual(ov.overlaps.shape, (ny * nx, 8, 6))
+
+            for j in range(ny):
+                for i in range(nx):
+                    name = fm.name_array[j, i]
+                    k = ov.tile_index[name]
+                    for d, (dj, di) in enumerate(OFFSETS):
+                        if 0 <= j + dj < ny and 0 <= i + di < nx:
+                            expected = brute_force_overlap(
+                                fm, name, fm.name_array[j + dj, i + di])
+                        else:
+                            expected = [0] * 6
+                        np.testing.assert_array_equal(
+                            ov.overlaps[k, d], expected,
+                            err_msg='{} {}'.format(name, DIRECTIONS[d]))
+
+    def test_read_only(self):
+        yml, _ = make_mosaic(self.dir)
+        ov = Overlaps(FileMatrix(yml))
+        with self.assertRaises(ValueError):
+            ov.overlaps[0, 0, 0] = 1
+
+
+class TestOverlapRecords(OverlapsTestCase):
+    def setUp(self):
+        super().setUp()
+        yml, _ = make_mosaic(self.dir)
+        self.fm = FileMatrix(yml)
+        self.ov = Overlaps(self.fm)
+
+    def test_getitem(self):
+        for name in self.fm.data_frame.index:
+            rec = self.ov[name]
+            self.assertEqual(rec.dtype, OVERLAP_DTYPE)
+            self.assertEqual(list(rec.dtype.names), COLUMNS)
+            self.assertEqual(rec.shape, (len(DIRECTIONS),))
+            self.assertFalse(rec.flags.writeable)
+            # precomputed once
+            self.assertIs(rec.base, self.ov[name].base)
+
+            k = self.ov.tile_index[name]
+            for c, col in enumerate(COLUMNS):
+                np.testing.assert_array_equal(rec[col],
+                                              self.ov.overlaps[k, :, c])
+
+    def test_direction_frames(self):
+        for d in DIRECTIONS:
+            df = getattr(self.ov, 'overlap_' + d)
+            self.assertEqual(list(df.columns), COLUMNS)
+            for name, row in df.iterrows():
+                rec = self.ov[name][DIRECTIONS.index(d)]
+                self.assertEqual(list(row.values), [rec[c] for c in COLUMNS])
+
+    def test_in_z_range(self):
+        name = self.fm.data_frame.index[0]
+        rec = self.ov[name]
+        z_from, z_to = 3, 6
+        ov = in_z_range(rec, z_from, z_to)
+
+        mask = (rec['Z_from'] <= z_to) & (rec['Z_to'] >= z_from)
+        self.assertEqual(len(ov), np.count_nonzero(mask))
+        np.testing.assert_array_equal(
+            ov['Z_from'], np.maximum(rec['Z_from'][mask] - z_from, 0))
+        np.testing.assert_array_equal(ov['Z_to'], rec['Z_to'][mask] - z_from)
+        np.testing.assert_array_equal(ov['X_to'], rec['X_to'][mask])
+
+        # a writable copy, the precomputed records are left untouched
+        ov['Z_to'] = 0
+        self.assertTrue(np.all(self.ov[name]['Z_to'][mask] > 0))
@@ -0,0 +1,80 @@
+import os
+import argparse
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import yaml
+
+from zetastitcher.io.filematrix import FileMatrix
+from zetastitcher.io.virtual_fused_volume import VirtualFusedVolume, \
+    overview_path, positions_hash
+from zetastitcher.fuser.overview import build_overview
+from zetastitcher.fuser.utils import parse_size
+
+from .mosaic import make_mosaic
+
+
+class TestParseSize(unittest.TestCase):
+    def test_parse_size(self):
+        self.assertEqual(parse_size('1024'), 1024)
+        self.assertEqual(parse_size('16G'), 16 * 2**30)
+        self.assertEqual(parse_size('1.5kb'), 1536)
+        self.assertEqual(parse_size(' 2 M '), 2 * 2**20)
+        with self.assertRaises(argparse.ArgumentTypeError):
+            parse_size('lots')
+
+
+class TestOverview(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.yml, self.volume = make_mosaic(self.dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_strided_from_overview(self):
+        build_overview(FileMatrix(self.yml), levels=2, n_of_threads=2)
+        with VirtualFusedVolume(self.yml) as vfv:
+            self.assertEqual(sorted(vfv._overview), [1, 2])
+            a = vfv[::2, ::2, ::2]
+            vfv.use_overview = False
+            b = vfv[::2, ::2, ::2]
+        self.assertEqual(a.shape, b.shape)
+        # averages of 2x2x2 blocks
+        self.assertFalse(np.array_equal(a, b))
+
+        with VirtualFusedVolume(self.yml) as vfv:
+            # unit steps are always fused from the tiles
+            np.testing.assert_array_equal(vfv[3:5], self.volume[3:5])
+
+    def test_positions_hash(self):
+        fm = FileMatrix(self.yml)
+        h = positions_hash(fm)
+        self.assertEqual(positions_hash(FileMatrix(self.yml)), h)
+
+        fm.data_frame.loc[fm.data_frame.index[0], 'Xs'] += 1
+        self.assertNotEqual(positions_hash(fm), h)
+
+    def test_outdated_overview_ignored(self):
+        build_overview(FileMatrix(self.yml), levels=2, n_of_threads=2)
+
+        # move a tile by one pixel: the volume shape does not change
+        with open(self.yml) as f:
+            y = yaml.safe_load(f)
+        y['filematrix'][0]['Ys'] += 1
+        with open(self.yml, 'w') as f:
+            yaml.dump(y, f, default_flow_style=False)
+
+        with VirtualFusedVolume(self.yml) as vfv:
+            self.assertEqual(vfv.shape, self.volume.shape)
+            with self.assertLogs('zetastitcher.io.virtual_fused_volume',
+                                 'WARNING'):
+                vfv._overview = vfv._open_overview()
+            self.assertEqual(vfv._overview, {})
+
+    def test_incomplete_overview_ignored(self):
+        os.makedirs(os.path.join(overview_path(self.yml), '1'))
+        with VirtualFusedVolume(self.yml) as vfv:
+            self.assertEqual(vfv._overview, {})
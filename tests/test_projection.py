@@ -0,0 +1,99 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from zetastitcher.io.inputfile import InputFile
+from zetastitcher.io.filematrix import FileMatrix
+from zetastitcher.io.virtual_fused_volume import VirtualFusedVolume
+from zetastitcher.fuser.fuse_runner import FuseRunner
+
+from .mosaic import make_mosaic
+
+
+def single_tile_mask(fm, shape):
+    """Pixels (Y, X) covered by exactly one tile."""
+    count = np.zeros(shape, dtype=int)
+    for row in fm.data_frame.itertuples():
+        count[row.Ys:row.Ys_end, row.Xs:row.Xs_end] += 1
+    return count == 1
+
+
+class ProjectionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def open(self, **kwargs):
+        self.yml, self.volume = make_mosaic(self.dir, **kwargs)
+        vfv = VirtualFusedVolume(self.yml)
+        self.addCleanup(vfv.close)
+        self.mask = single_tile_mask(vfv.fm, vfv.shape[-2:])
+        return vfv
+
+
+class TestProjection(ProjectionTestCase):
+    def test_max(self):
+        vfv = self.open()
+        for z0, z1 in [(0, None), (0, 5), (3, 11), (12, 14)]:
+            p = vfv.projection('max', z0, z1)
+            self.assertEqual(p.shape, vfv.shape[-2:])
+            self.assertEqual(p.dtype, vfv.dtype)
+            expected = vfv[z0:z1].max(axis=0)
+            np.testing.assert_array_equal(p[self.mask], expected[self.mask])
+
+    def test_mean(self):
+        # some tiles start at Z = 2, others end at Z = 12
+        vfv = self.open(dtype=np.float32)
+        for z0, z1 in [(0, None), (0, 5), (3, 11), (11, 14)]:
+            p = vfv.projection('mean', z0, z1)
+            expected = vfv[z0:z1].mean(axis=0)
+            np.testing.assert_allclose(p[self.mask], expected[self.mask],
+                                       rtol=1e-5)
+
+    def test_invalid_mode(self):
+        vfv = self.open()
+        with self.assertRaises(ValueError):
+            vfv.projection('min')
+
+
+class TestChannels(ProjectionTestCase):
+    def test_channels(self):
+        vfv = self.open(nchannels=3)
+        volume = self.volume.astype(np.uint64)
+
+        p = vfv.projection('max', 2, 9)
+        self.assertEqual(p.shape, vfv.shape[1:])
+
+        p = vfv.projection('max', 2, 9, channel=1)
+        self.assertEqual(p.shape, vfv.shape[-2:])
+        np.testing.assert_array_equal(
+            p[self.mask], volume[2:9, 1].max(axis=0)[self.mask])
+
+        p = vfv.projection('max', 2, 9, channel=-2)
+        self.assertEqual(p.shape, vfv.shape[-2:])
+        np.testing.assert_array_equal(
+            p[self.mask], volume[2:9].sum(axis=1).max(axis=0)[self.mask])
+
+        # the channel of pooled tile handles is restored
+        np.testing.assert_array_equal(vfv[4], self.volume[4])
+
+    def test_fuse_runner(self):
+        self.open(nchannels=3)
+        out = os.path.join(self.dir, 'mip.tif')
+        for channel, expected in [
+                (-2, self.volume.astype(np.uint64).sum(axis=1).max(axis=0)),
+                (0, self.volume[:, 0].max(axis=0))]:
+            fr = FuseRunner(FileMatrix(self.yml))
+            fr.output_filename = out
+            fr.mip = 'max'
+            fr.channel = channel
+            fr.run()
+            with InputFile(out) as f:
+                a = np.squeeze(f.whole())
+            self.assertEqual(a.shape, self.volume.shape[-2:])
+            np.testing.assert_array_equal(a[self.mask], expected[self.mask])
@@ -0,0 +1,93 @@
+import os
+import math
+import shutil
+import tempfile
+import unittest
+
+from unittest import mock
+
+import numpy as np
+
+from zetastitcher.fuser import fuse
+from zetastitcher.fuser.fuse import squircle_alpha, _squircle_alpha
+
+
+def reference_squircle_alpha(height, width):
+    """Pixel by pixel implementation of the blending mask."""
+    squircle = np.zeros((height, width))
+    ratio = width / height
+    a = width // 2
+    b = height // 2
+    N = max(a, b)
+    ps = np.logspace(np.log10(2), np.log10(50), N)
+    alpha = np.linspace(0, 1, N)
+
+    if a > b:
+        dra = a / N
+        ras = np.arange(0, a, dra) + 1
+        rbs = ras / ratio
+        drb = dra / ratio
+    else:
+        drb = b / N
+        rbs = np.arange(0, b, drb) + 1
+        ras = rbs * ratio
+        dra = drb * ratio
+
+    for y in range(b):
+        for x in range(a):
+            i = int(max(x / dra, y / drb))
+            count = -1
+            for p, ra, rb in zip(ps[i:], ras[i:], rbs[i:]):
+                count += 1
+                if math.pow(x / ra, p) + math.pow(y / rb, p) < 1:
+                    break
+            squircle[y + b, x + a] = alpha[i + count] ** 2
+
+    squircle[:b, a:] = np.flipud(squircle[b:, a:])
+    squircle[:, :a] = np.fliplr(squircle[:, a:])
+
+    return 1 - squircle
+
+
+class TestSquircle(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        patcher = mock.patch.object(fuse, 'SQUIRCLE_CACHE_DIR', self.dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_vectorized(self):
+        for shape in [(20, 30), (32, 18), (16, 16), (10, 40)]:
+            np.testing.assert_allclose(_squircle_alpha(*shape),
+                                       reference_squircle_alpha(*shape))
+
+    def test_disk_cache(self):
+        a = squircle_alpha.__wrapped__(20, 30)
+        files = os.listdir(self.dir)
+        # versioned name, no temporary files left behind
+        self.assertEqual(files, ['squircle_v{}_20x30.npy'.format(
+            fuse.SQUIRCLE_VERSION)])
+        np.testing.assert_array_equal(np.load(os.path.join(self.dir,
+                                                           files[0])), a)
+
+        with mock.patch.object(fuse, '_squircle_alpha') as m:
+            b = squircle_alpha.__wrapped__(20, 30)
+            m.assert_not_called()
+        np.testing.assert_array_equal(a, b)
+
+    def test_stale_cache_ignored(self):
+        fname = os.path.join(self.dir, 'squircle_v{}_20x30.npy'.format(
+            fuse.SQUIRCLE_VERSION))
+        np.save(fname, np.zeros((3, 3)))
+        a = squircle_alpha.__wrapped__(20, 30)
+        np.testing.assert_array_equal(a, _squircle_alpha(20, 30))
+
+        with mock.patch.object(fuse, 'SQUIRCLE_VERSION',
+                               fuse.SQUIRCLE_VERSION + 1), \
+                mock.patch.object(fuse, '_squircle_alpha',
+                                  wraps=_squircle_alpha) as m:
+            squircle_alpha.__wrapped__(20, 30)
+            m.assert_called_once_with(20, 30)
@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from zetastitcher.io.tiffwrapper import TiffWrapper
+
+from .mosaic import write_stack
+
+
+class TestTiffWrapper(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 4000, (11, 20, 30)).astype(np.uint16)
+        self.fname = os.path.join(self.dir, 'stack.tif')
+        write_stack(self.fname, self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_shape(self):
+        w = TiffWrapper(self.fname)
+        self.assertEqual(w.shape, self.data.shape)
+        self.assertEqual(w.dtype, self.data.dtype)
+        w.close()
+
+    def test_concurrent_zslice(self):
+        for n in [1, 3, 16]:
+            w = TiffWrapper(self.fname)
+            w.n_of_threads = n
+            for start, stop in [(0, 11), (2, 9), (5, 6)]:
+                np.testing.assert_array_equal(
+                    w.zslice(start, stop), self.data[start:stop])
+            np.testing.assert_array_equal(
+                w.zslice(0, 11, dtype=np.float32),
+                self.data.astype(np.float32))
+            w.close()
@@ -0,0 +1,73 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from zetastitcher.io.filematrix import FileMatrix
+from zetastitcher.io.tileindex import TileIndex
+from zetastitcher.fuser.fuse_runner import FuseRunner
+
+from .mosaic import make_mosaic
+
+
+def brute_force_query(df, z_from, z_to, y_from, y_to, x_from, x_to):
+    ret = []
+    for i, row in enumerate(df.itertuples()):
+        if (row.Zs < z_to and row.Zs_end > z_from
+                and row.Ys < y_to and row.Ys_end > y_from
+                and row.Xs < x_to and row.Xs_end > x_from):
+            ret.append(i)
+    return ret
+
+
+def random_tiles(n, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Zs': rng.integers(0, 50, n), 'Ys': rng.integers(-100, 1000, n),
+        'Xs': rng.integers(0, 2000, n)})
+    df['Zs_end'] = df['Zs'] + rng.integers(1, 40, n)
+    df['Ys_end'] = df['Ys'] + rng.integers(1, 300, n)
+    df['Xs_end'] = df['Xs'] + rng.integers(1, 300, n)
+    return df
+
+
+class TestTileIndex(unittest.TestCase):
+    def test_query(self):
+        df = random_tiles(200)
+        index = TileIndex(df)
+        rng = np.random.default_rng(1)
+        for _ in range(300):
+            z, y, x = rng.integers(-10, 60), rng.integers(-200, 1200), \
+                rng.integers(-100, 2300)
+            region = (z, z + rng.integers(1, 30), y, y + rng.integers(1, 500),
+                      x, x + rng.integers(1, 500))
+            np.testing.assert_array_equal(index.query(*region),
+                                          brute_force_query(df, *region))
+
+    def test_empty(self):
+        index = TileIndex(random_tiles(10))
+        self.assertEqual(len(index.query(0, 10, 5000, 6000, 0, 100)), 0)
+        self.assertEqual(len(index.query(5, 5, 0, 1000, 0, 1000)), 0)
+
+
+class TestFuseRunnerBlocks(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_tiles_in_block(self):
+        yml, _ = make_mosaic(self.dir, ny=3, nx=3)
+        fr = FuseRunner(FileMatrix(yml))
+        fr._build_schedule()
+
+        df = fr.fm.data_frame
+        for block in [(0, 14, 0, 200, 0, 200), (0, 2, 0, 200, 0, 200),
+                      (5, 9, 30, 40, 0, 45), (3, 4, 70, 71, 80, 81)]:
+            tiles = fr._tiles_in_block(*block)
+            expected = df.iloc[brute_force_query(df, *block)]
+            expected = expected.sort_values('Zs', kind='mergesort')
+            self.assertEqual([t.Index for t in tiles], list(expected.index))
@@ -0,0 +1,241 @@
+import gc
+import shutil
+import threading
+import tempfile
+import unittest
+import weakref
+
+from unittest import mock
+
+import numpy as np
+
+from zetastitcher.io.inputfile import InputFile
+from zetastitcher.io.filematrix import FileMatrix
+from zetastitcher.io.virtual_fused_volume import VirtualFusedVolume
+from zetastitcher.fuser.fuse_runner import FuseRunner
+
+from .mosaic import make_mosaic
+
+
+class VirtualFusedVolumeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.yml, self.volume = make_mosaic(self.dir)
+        self.vfv = VirtualFusedVolume(self.yml)
+
+    def tearDown(self):
+        self.vfv.close()
+        shutil.rmtree(self.dir)
+
+
+class TestCache(VirtualFusedVolumeTestCase):
+    def test_uncached(self):
+        self.assertEqual(self.vfv.cache_size, 0)
+        with mock.patch.object(self.vfv, '_fuse',
+                               wraps=self.vfv._fuse) as m:
+            a = self.vfv[5]
+            b = self.vfv[5]
+        np.testing.assert_array_equal(a, self.volume[5])
+        np.testing.assert_array_equal(b, a)
+
+        # only the requested plane is fused, every time
+        self.assertEqual(m.call_count, 2)
+        myitem = m.call_args[0][0]
+        self.assertEqual((myitem[0].start, myitem[0].stop), (5, 6))
+        self.assertEqual(len(self.vfv._cache), 0)
+
+    def test_cached(self):
+        self.vfv.cache_size = 1024 ** 2
+        self.vfv.chunk_shape = (4, 32, 32)
+        with mock.patch.object(self.vfv, '_fuse',
+                               wraps=self.vfv._fuse) as m:
+            a = self.vfv[5, 10:40, 20:70]
+            n_chunks = m.call_count
+            self.assertEqual(n_chunks, 2 * 3)
+            # chunks are fused whole
+            myitem = m.call_args[0][0]
+            self.assertEqual((myitem[0].start, myitem[0].stop), (4, 8))
+
+            b = self.vfv[5:7, 12:30, 40:60]
+            self.assertEqual(m.call_count, n_chunks)
+        np.testing.assert_array_equal(a, self.volume[5, 10:40, 20:70])
+        np.testing.assert_array_equal(b, self.volume[5:7, 12:30, 40:60])
+        np.testing.assert_array_equal(self.vfv[...], self.volume)
+
+    def test_eviction(self):
+        self.vfv.chunk_shape = (4, 32, 32)
+        chunk = 4 * 32 * 32 * self.volume.itemsize
+        self.vfv.cache_size = 3 * chunk
+        np.testing.assert_array_equal(self.vfv[...], self.volume)
+        self.assertGreater(len(self.vfv._cache), 0)
+        self.assertLessEqual(self.vfv._cache_bytes, self.vfv.cache_size)
+
+        self.vfv.close()
+        self.assertEqual(len(self.vfv._cache), 0)
+        self.assertEqual(self.vfv._cache_bytes, 0)
+
+    def test_strided_not_cached(self):
+        self.vfv.cache_size = 1024 ** 2
+        a = self.vfv[::2, ::3, ::5]
+        np.testing.assert_array_equal(a, self.volume[::2, ::3, ::5])
+        self.assertEqual(len(self.vfv._cache), 0)
+
+    def test_tiles_kept_open(self):
+        with mock.patch('zetastitcher.io.inputfilepool.InputFile',
+                        wraps=InputFile) as m:
+            for z in range(self.volume.shape[0]):
+                np.testing.assert_array_equal(self.vfv[z], self.volume[z])
+        self.assertEqual(m.call_count, 6)
+
+
+class TestThreads(VirtualFusedVolumeTestCase):
+    def test_concurrent_reads(self):
+        self.vfv.n_of_threads = 4
+        barrier = threading.Barrier(2, timeout=10)
+        tile_region = self.vfv._tile_region
+
+        def wait_for_another_reader(*args):
+            barrier.wait()  # raises if tiles are read one at a time
+            return tile_region(*args)
+
+        with mock.patch.object(self.vfv, '_tile_region',
+                               side_effect=wait_for_another_reader):
+            a = self.vfv[...]
+        np.testing.assert_array_equal(a, self.volume)
+
+    def test_deterministic(self):
+        # float sums within overlaps do not depend on thread scheduling
+        self.yml, self.volume = make_mosaic(self.dir, dtype=np.float32)
+        results = []
+        for n in [1, 2, 8]:
+            with VirtualFusedVolume(self.yml) as vfv:
+                vfv.n_of_threads = n
+                results.append(vfv[2:9, 5:70, 3:120])
+        for a in results[1:]:
+            np.testing.assert_array_equal(a, results[0])
+        np.testing.assert_allclose(results[0], self.volume[2:9, 5:70, 3:120],
+                                   rtol=1e-5)
+
+
+class TestGetRegions(VirtualFusedVolumeTestCase):
+    items = [np.index_exp[3, 10:40, 20:70],
+             np.index_exp[3:6, 12:45, 30:90],
+             np.index_exp[::-2, 5:70:3, ::4],
+             np.index_exp[7, ..., -20:],
+             np.index_exp[2:2],
+             np.index_exp[...]]
+
+    def test_same_as_getitem(self):
+        regions = self.vfv.get_regions(self.items)
+        self.assertEqual(len(regions), len(self.items))
+        for item, a in zip(self.items, regions):
+            np.testing.assert_array_equal(a, self.vfv[item])
+            if a.size:
+                np.testing.assert_array_equal(a,
+                                              np.squeeze(self.volume[item]))
+
+    def test_tiles_read_once(self):
+        reads = []
+        pool_get = self.vfv._pool.get
+
+        def get(file_name):
+            reads.append(file_name)
+            return pool_get(file_name)
+
+        with mock.patch.object(self.vfv._pool, 'get', side_effect=get):
+            self.vfv.get_regions(self.items)
+        self.assertEqual(len(reads), 6)
+        self.assertEqual(len(set(reads)), 6)
+
+    def decoded_frames(self, vfv, items):
+        """Query `items` at once, returning the regions and the number of
+        frames decoded from the tiles and of reads."""
+        frames = []
+        zslice = InputFile.zslice
+
+        def count(f, start_frame, end_frame=None, *args, **kwargs):
+            end = start_frame + 1 if end_frame is None else end_frame
+            frames.append(end - start_frame)
+            return zslice(f, start_frame, end_frame, *args, **kwargs)
+
+        with mock.patch.object(InputFile, 'zslice', autospec=True,
+                               side_effect=count):
+            regions = vfv.get_regions(items)
+        return regions, sum(frames), len(frames)
+
+    def test_sparse_frames(self):
+        self.yml, self.volume = make_mosaic(self.dir, tile_shape=(40, 40, 50))
+        with VirtualFusedVolume(self.yml) as vfv:
+            # patches within the same tile, far apart along Z
+            items = [np.index_exp[z, 5:15, 5:15] for z in [3, 38, 20]]
+            regions, n_of_frames, n_of_reads = self.decoded_frames(vfv, items)
+            self.assertEqual(n_of_frames, 3)
+            self.assertEqual(n_of_reads, 3)
+
+            # adjacent and overlapping ranges are read at once
+            items = [np.index_exp[10:14, 5:15, 5:15],
+                     np.index_exp[14:16, 8:20, 5:15],
+                     np.index_exp[12, 5:15, 5:15]]
+            regions, n_of_frames, n_of_reads = self.decoded_frames(vfv, items)
+            self.assertEqual(n_of_frames, 6)
+            self.assertEqual(n_of_reads, 1)
+
+            for item, a in zip(items, regions):
+                np.testing.assert_array_equal(a, self.volume[item])
+
+    def test_float(self):
+        self.yml, self.volume = make_mosaic(self.dir, dtype=np.float32)
+        with VirtualFusedVolume(self.yml) as vfv:
+            for item, a in zip(self.items, vfv.get_regions(self.items)):
+                np.testing.assert_array_equal(a, vfv[item])
+
+
+class TestMetadata(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.yml, self.volume = make_mosaic(self.dir, nchannels=3,
+                                            dtype=np.uint8)
+        # record dtype and number of channels in the .yml file
+        fm = FileMatrix(self.yml)
+        fm.tile_metadata()
+        fm.save_to_yaml(self.yml, 'update')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_no_io(self):
+        with mock.patch('zetastitcher.io.filematrix.InputFile') as m1, \
+                mock.patch('zetastitcher.io.inputfilepool.InputFile') as m2, \
+                mock.patch('zetastitcher.io.virtual_fused_volume.InputFile') \
+                as m3:
+            vfv = VirtualFusedVolume(self.yml)
+            self.assertEqual(vfv.shape, self.volume.shape)
+            self.assertEqual(vfv.dtype, np.uint8)
+            self.assertEqual(vfv.nchannels, 3)
+
+            fr = FuseRunner(FileMatrix(self.yml))
+            self.assertEqual(fr.dtype, np.uint8)
+            self.assertTrue(fr.is_multichannel)
+            self.assertEqual(fr.output_shape, self.volume.shape)
+            fr.channel = 1
+            self.assertFalse(fr.is_multichannel)
+            self.assertEqual(fr.output_shape, self.volume[:, 0].shape)
+        for m in [m1, m2, m3]:
+            m.assert_not_called()
+
+    def test_released(self):
+        # metadata are not cached in global caches keeping instances alive
+        vfv = VirtualFusedVolume(self.yml)
+        vfv.shape, vfv.dtype
+        ref = weakref.ref(vfv)
+        vfv.close()
+        del vfv
+        gc.collect()
+        self.assertIsNone(ref())
+
+        fr = FuseRunner(FileMatrix(self.yml))
+        fr.dtype, fr.is_multichannel, fr.output_shape
+        ref = weakref.ref(fr)
+        del fr
+        gc.collect()
+        self.assertIsNone(ref())
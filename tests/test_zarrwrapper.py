@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from zetastitcher.io.inputfile import InputFile
+
+from .mosaic import write_stack
+
+
+class TestZarrWrapper(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 4000, (9, 20, 30)).astype(np.uint16)
+        self.fname = os.path.join(self.dir, 'stack.zarr')
+        write_stack(self.fname, self.data, 'zarr')
+
+        self.rgb = rng.integers(0, 255, (9, 20, 30, 3)).astype(np.uint8)
+        self.rgb_fname = os.path.join(self.dir, 'rgb.zarr')
+        write_stack(self.rgb_fname, self.rgb, 'zarr')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_zslice(self):
+        with InputFile(self.fname) as f:
+            self.assertEqual(f.shape, self.data.shape)
+            self.assertEqual(f.dtype, self.data.dtype)
+            np.testing.assert_array_equal(f.zslice(2, 7), self.data[2:7])
+
+    def test_getitem(self):
+        with InputFile(self.fname) as f:
+            for item in [np.index_exp[3, 2:10, ::3],
+                         np.index_exp[::-2, 5, 1:-1],
+                         np.index_exp[..., 4],
+                         np.index_exp[1:8:3, ::-1, 2:29:5]]:
+                np.testing.assert_array_equal(f[item], self.data[item])
+
+    def test_multichannel(self):
+        zcyx = np.moveaxis(self.rgb, -1, 1)
+        with InputFile(self.rgb_fname) as f:
+            self.assertEqual(f.shape, zcyx.shape)
+            np.testing.assert_array_equal(f.zslice(0, 9), zcyx)
+            np.testing.assert_array_equal(f[2:5, :, 3:9], zcyx[2:5, :, 3:9])
+
+            f.channel = 2
+            np.testing.assert_array_equal(f[1:4, 5:7],
+                                          self.rgb[1:4, 5:7, :, 2])
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import zarr
+
+from zetastitcher.io.zarrwriter import ZarrPyramidWriter, downsample
+
+
+class TestZarrPyramidWriter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'out.zarr')
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 4000, (13, 21, 30)).astype(np.uint16)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, data, slabs, **kwargs):
+        w = ZarrPyramidWriter(self.path, data.shape, data.dtype, levels=3,
+                              chunks=(4, 8, 8), **kwargs)
+        z = 0
+        for n in slabs:
+            w.write(data[z:z + n])
+            z += n
+        w.close()
+        return zarr.open_group(self.path, mode='r')
+
+    def test_pyramid(self):
+        root = self._write(self.data, [3, 5, 1, 4])
+        np.testing.assert_array_equal(root['0'][:], self.data)
+
+        expected = self.data
+        for level in [1, 2]:
+            expected = downsample(expected, self.data.dtype)
+            np.testing.assert_array_equal(root[str(level)][:], expected)
+
+        # slab boundaries do not change the result
+        other = os.path.join(self.dir, 'other.zarr')
+        os.rename(self.path, other)
+        root = self._write(self.data, [13])
+        np.testing.assert_array_equal(
+            root['2'][:], zarr.open_group(other, mode='r')['2'][:])
+
+    def test_downsample(self):
+        a = np.arange(2 * 4 * 6, dtype=np.float32).reshape(2, 4, 6)
+        d = downsample(a, np.float32)
+        self.assertEqual(d.shape, (1, 2, 3))
+        self.assertEqual(d[0, 0, 0], a[:2, :2, :2].mean())
+        self.assertEqual(downsample(a[:1, :3, :5], np.float32).shape,
+                         (1, 2, 3))
+
+    def test_no_full_resolution(self):
+        root = self._write(self.data, [13], full_resolution=False)
+        self.assertNotIn('0', root)
+        self.assertEqual(root['1'].shape, (7, 11, 15))
+
+    def test_metadata(self):
+        root = self._write(self.data, [13])
+        ms = root.attrs['multiscales'][0]
+        self.assertEqual(ms['version'], '0.4')
+        self.assertEqual([a['name'] for a in ms['axes']], ['z', 'y', 'x'])
+        self.assertEqual([d['path'] for d in ms['datasets']],
+                         ['0', '1', '2'])
+        self.assertEqual(
+            ms['datasets'][2]['coordinateTransformations'][0]['scale'],
+            [4, 4, 4])
+
+    def test_metadata_multichannel(self):
+        data = np.zeros((4, 6, 8, 3), dtype=np.uint8)
+        root = self._write(data, [4])
+        ms = root.attrs['multiscales'][0]
+        # channels are stored last, which is not valid OME-Zarr
+        self.assertNotIn('version', ms)
+        self.assertNotIn('axes', ms)
+        self.assertEqual(root['1'].shape, (2, 3, 4, 3))
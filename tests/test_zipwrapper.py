@@ -0,0 +1,71 @@
+import io
+import os
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+import numpy as np
+import imageio
+
+from zetastitcher.io.zipwrapper import ZipWrapper
+
+from .mosaic import write_stack
+
+
+class TestZipWrapper(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.data = rng.integers(0, 4000, (7, 20, 30)).astype(np.uint16)
+        self.fname = os.path.join(self.dir, 'stack.zip')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_zslice(self):
+        write_stack(self.fname, self.data, 'zip')
+        for n in [1, 4]:
+            w = ZipWrapper(self.fname)
+            w.n_of_threads = n
+            self.assertEqual(w.shape, self.data.shape)
+            np.testing.assert_array_equal(w.zslice(0, 7), self.data)
+            np.testing.assert_array_equal(w.zslice(3, 5), self.data[3:5])
+            np.testing.assert_array_equal(w.frame(6), self.data[6])
+            w.close()
+
+    def test_frame_order(self):
+        # members are sorted by name, regardless of their order in the
+        # archive
+        with zipfile.ZipFile(self.fname, 'w') as zf:
+            for k in [3, 0, 6, 1, 5, 2, 4]:
+                zf.writestr('{:04d}.png'.format(k), self._png(self.data[k]))
+        w = ZipWrapper(self.fname)
+        np.testing.assert_array_equal(w.zslice(0, 7), self.data)
+        w.close()
+
+    def test_other_members_ignored(self):
+        with zipfile.ZipFile(self.fname, 'w') as zf:
+            zf.writestr('README', 'not a frame')
+            zf.writestr('.DS_Store', b'\0' * 16)
+            zf.writestr('__MACOSX/._0000.png', b'\0' * 16)
+            zf.writestr(zipfile.ZipInfo('frames/'), '')
+            for k in range(7):
+                zf.writestr('frames/{:04d}.png'.format(k),
+                            self._png(self.data[k]))
+        w = ZipWrapper(self.fname)
+        self.assertEqual(w.nfrms, 7)
+        np.testing.assert_array_equal(w.zslice(0, 7), self.data)
+        w.close()
+
+    def test_no_frames(self):
+        with zipfile.ZipFile(self.fname, 'w') as zf:
+            zf.writestr('README', 'not a frame')
+        with self.assertRaises(zipfile.BadZipFile):
+            ZipWrapper(self.fname)
+
+    @staticmethod
+    def _png(frame):
+        b = io.BytesIO()
+        imageio.imwrite(b, frame, format='png')
+        return b.getvalue()
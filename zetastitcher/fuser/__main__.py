@@ -9,8 +9,10 @@ import coloredlogs
 from ..version import __version__
 
 from . import absolute_positions
+from .utils import CustomFormatter, parse_size
 from .fuse_runner import FuseRunner
 from ..io.filematrix import FileMatrix
+from ..io.virtual_fused_volume import PROJECTIONS
 from .xcorr_filematrix import XcorrFileMatrix
 from .global_optimization import absolute_position_global_optimization
 
@@ -18,11 +20,6 @@ logger = logging.getLogger(__name__)
 coloredlogs.install(level='DEBUG', fmt='%(levelname)s [%(name)s]: %(message)s')
 
 
-class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
-                      argparse.RawDescriptionHelpFormatter):
-    pass
-
-
 ABS_MODE_NOMINAL_POSITIONS = 'nominal_positions'
 ABS_MODE_MAXIMUM_SCORE = 'maximum_score'
 ABS_MODE_WEIGHTED_AVERAGE = 'maximum_score'
@@ -46,7 +43,30 @@ def parse_args():
     group.add_argument('-o', type=str, dest='output_filename',
                        help='output file name. If not specified, no tiff '
                             'output is produced, only absolute coordinates '
-                            'are computed.')
+                            'are computed. If the name ends with .zarr, a '
+                            'chunked multiscale Zarr store is produced '
+                            'instead.')
+
+    group.add_argument('--max-memory', type=parse_size, dest='max_memory',
+                       help='memory budget for fusion, in bytes or with a '
+                            'K, M, G, T suffix (e.g. 16G). If not specified, '
+                            'use the available memory.')
+
+    group.add_argument('--max-open-files', type=int, dest='max_open_files',
+                       help='maximum number of input files kept open during '
+                            'fusion. If not specified, all input files are '
+                            'kept open and read without reopening them.')
+
+    group.add_argument('--levels', type=int, default=4,
+                       dest='pyramid_levels',
+                       help='number of resolution levels, including full '
+                            'resolution (.zarr output only)')
+
+    group.add_argument('--mip', nargs='?', const='max', choices=PROJECTIONS,
+                       help='save the projection along Z (max by default) '
+                            'instead of the fused volume. Tiles are '
+                            'projected one by one and blended in 2D, without '
+                            'fusing the volume.')
 
     group.add_argument('-w', type=str, dest='yml_out_file',
                        help='save data to a different .yml file')
@@ -57,6 +77,10 @@ def parse_args():
     group.add_argument('-c', type=int, default=-1, dest='channel',
                        help='channel')
 
+    group.add_argument('-n', type=int, default=8, dest='n_of_threads',
+                       help='number of parallel threads to use for decoding '
+                            'input files')
+
     group.add_argument('--zmin', type=float, default=0,
                        help='start frame (in your units)')
     me_group = group.add_mutually_exclusive_group()
@@ -251,7 +275,9 @@ def main():
     if args.output_filename is not None:
         fr = FuseRunner(fm)
 
-        keys = ['zmin', 'zmax', 'output_filename', 'debug', 'channel']
+        keys = ['zmin', 'zmax', 'output_filename', 'debug', 'channel',
+                'n_of_threads', 'pyramid_levels', 'max_memory', 'mip',
+                'max_open_files']
 
         for k in keys:
             setattr(fr, k, getattr(args, k))
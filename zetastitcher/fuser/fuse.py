@@ -1,16 +1,16 @@
+import os
 import re
-import math
+import itertools
+import threading
+
 import numpy as np
 
 from functools import lru_cache
+from collections import OrderedDict
 
 from .lcd_numbers import numbers, canvas_shape
 
 
-def flatten(my_list):
-    return [item for sublist in my_list for item in sublist]
-
-
 def to_dtype(x, dtype):
     if x.dtype == dtype:
         return x
@@ -19,15 +19,54 @@ def to_dtype(x, dtype):
     return x.astype(dtype, copy=False)
 
 
+SQUIRCLE_CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'zetastitcher')
+"""Directory where blending masks computed by :func:`squircle_alpha` are
+cached."""
+
+SQUIRCLE_VERSION = 1
+"""Version of the blending mask computation, part of the name of the cached
+files. Increase it whenever :func:`_squircle_alpha` changes, so that stale
+masks are not loaded."""
+
+
 @lru_cache()
 def squircle_alpha(height, width):
+    """Blending mask of shape (`height`, `width`).
+
+    Masks are cached in memory and on disk (in :data:`SQUIRCLE_CACHE_DIR`),
+    so that they are computed only once across processes.
+    """
+    fname = os.path.join(SQUIRCLE_CACHE_DIR, 'squircle_v{}_{}x{}.npy'.format(
+        SQUIRCLE_VERSION, height, width))
+    try:
+        squircle = np.load(fname)
+        if squircle.shape == (height, width):
+            return squircle
+    except (OSError, ValueError):
+        pass
+
+    squircle = _squircle_alpha(height, width)
+
+    try:
+        os.makedirs(SQUIRCLE_CACHE_DIR, exist_ok=True)
+        # write to a temporary file first, other processes may be reading
+        tmp_fname = '{}.{}.tmp'.format(fname, os.getpid())
+        with open(tmp_fname, 'wb') as f:
+            np.save(f, squircle)
+        os.replace(tmp_fname, fname)
+    except OSError:
+        pass
+
+    return squircle
+
+
+def _squircle_alpha(height, width):
     squircle = np.zeros((height, width))
     ratio = width / height
     a = width // 2
     b = height // 2
-    grid = np.vstack(np.meshgrid(np.linspace(0, b - 1, b),
-                                 np.linspace(0, a - 1, a))).reshape(2, -1).T
-    grid = grid.astype(np.int)
     N = max(a, b)
     ps = np.logspace(np.log10(2), np.log10(50), N)  # exponents
     # ps = np.ones(N) * 2
@@ -44,21 +83,35 @@ def squircle_alpha(height, width):
         ras = rbs * ratio
         dra = drb * ratio
 
-    for y, x in grid:
-        j = x / dra
-        k = y / drb
-        i = int(max(j, k))
-        count = -1  # 0-based
-        for n, p, ra, rb in zip(range(0, N - i), ps[i:], ras[i:], rbs[i:]):
-            count += 1
+    y, x = np.meshgrid(np.arange(0, b), np.arange(0, a), indexing='ij')
+    y = y.ravel()
+    x = x.ravel()
 
-            constant = math.pow(x / ra, p) + math.pow(y / rb, p)
+    def inside(x, y, n):
+        """Whether points (x, y) are inside the n-th squircles."""
+        return (np.power(x / ras[n], ps[n]) + np.power(y / rbs[n], ps[n])) < 1
 
-            if constant < 1:
-                break
+    # index of the first squircle to be tested, for each pixel
+    i = np.maximum(x / dra, y / drb).astype(int)
+
+    # For n > i, both x / ras[n] and y / rbs[n] are smaller than 1 and
+    # decrease with n, while the exponents increase: the test is monotonic in
+    # n, so that the first squircle containing each pixel can be found by
+    # bisection on [i + 1, N), N meaning none (i.e. the outermost one).
+    lo = i + 1
+    hi = np.full_like(i, N)
+    todo = lo < hi
+    while np.any(todo):
+        mid = (lo[todo] + hi[todo]) // 2
+        found = inside(x[todo], y[todo], mid)
+        hi[todo] = np.where(found, mid, hi[todo])
+        lo[todo] = np.where(found, lo[todo], mid + 1)
+        todo = lo < hi
 
-        ii = i + count
-        squircle[y + b, x + a] = alpha[ii] ** 2
+    ii = np.minimum(lo, N - 1)
+    ii = np.where(inside(x, y, i), i, ii)
+
+    squircle[y + b, x + a] = alpha[ii] ** 2
 
     squircle[:b, a:] = np.flipud(squircle[b:, a:])
     squircle[:, :a] = np.fliplr(squircle[:, a:])
@@ -68,6 +121,100 @@ def squircle_alpha(height, width):
     return squircle
 
 
+NORMALIZATION_CACHE_SIZE = 64 * 2**20
+"""Maximum size in bytes of the normalization factors cached by
+:func:`normalization_factor`."""
+
+
+class ByteBoundedCache(object):
+    """A thread-safe LRU cache of arrays, bounded by their size in bytes.
+
+    Values larger than :attr:`max_bytes` are not cached.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def get(self, key):
+        """Return the cached value for `key`, or `None` if not cached."""
+        with self._lock:
+            value = self._cache.get(key)
+            if value is not None:
+                self._cache.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._cache or value.nbytes > self.max_bytes:
+                return
+            self._cache[key] = value
+            self.nbytes += value.nbytes
+            while self.nbytes > self.max_bytes:
+                _, old = self._cache.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.nbytes = 0
+
+
+_normalization_cache = ByteBoundedCache(NORMALIZATION_CACHE_SIZE)
+
+
+def normalization_factor(frame_shape, rects):
+    """Blending factor for a tile overlapping adjacent tiles over `rects`.
+
+    The result depends only on the overlap configuration, therefore it is
+    cached (up to :data:`NORMALIZATION_CACHE_SIZE` bytes) and shared by all
+    tiles and z intervals with the same one.
+
+    Parameters
+    ----------
+    frame_shape : tuple
+        Shape of a stack plane (XY).
+    rects : tuple
+        Overlapping regions, each one in the form ``(Y_from, Y_to, X_from,
+        X_to)`` (in tile coordinates).
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        A read-only float32 array of shape `frame_shape`: the tile weights
+        normalized by the sum of the weights of all overlapping tiles.
+    """
+    key = (frame_shape, rects)
+    factor = _normalization_cache.get(key)
+    if factor is not None:
+        return factor
+
+    xy_weights = squircle_alpha(*frame_shape)
+    sums = np.copy(xy_weights)
+
+    for y_from, y_to, x_from, x_to in rects:
+        w = xy_weights[:y_to - y_from, :x_to - x_from]
+
+        if x_from == 0:
+            w = np.fliplr(w)
+        if y_from == 0:
+            w = np.flipud(w)
+
+        sums[y_from:y_to, x_from:x_to] += w
+
+    with np.errstate(invalid='ignore'):
+        factor = (xy_weights / sums).astype(np.float32)
+
+    factor.setflags(write=False)
+    _normalization_cache.put(key, factor)
+    return factor
+
+
 def fuse_queue(q, dest, frame_shape, debug=False):
     """Fuse a queue of images along Y, optionally applying padding.
 
@@ -75,14 +222,7 @@ def fuse_queue(q, dest, frame_shape, debug=False):
     ----------
     q : :py:class:`queue.Queue`
         A queue containing elements in the form ``[hyperslice, index, zfrom,
-        offset_idx, top_left, overlaps]`` where `hyperslice` is a
-        `numpy.ndarray`, `index` and `zfrom` are the tile index in the
-        pandas dataframe and the starting frame in the original stack (these
-        two are used for debugging purposes only), `offset_idx` is a
-        tuple of :class:`slice` objects with the slice offset inside a single
-        stack, `top_left` is a list specifying the image position in the form
-        ``[Z, Y, X]``, `overlaps` is a :class:`pandas.DataFrame` specifying
-        overlaps with adjacent tiles.
+        offset_idx, top_left, overlaps]``, see :func:`fuse_tile`.
     frame_shape : tuple
         Shape of a stack plane (XY).
     dest : :class:`numpy.ndarray`
@@ -97,80 +237,361 @@ def fuse_queue(q, dest, frame_shape, debug=False):
         if got is None:
             break
 
-        slice, index_dbg, zfrom_dbg, sl, pos, overlaps = got
+        fuse_tile(dest, *got, frame_shape=frame_shape, debug=debug)
+
+        q.task_done()
+
 
+def fuse_tile(dest, slice, index_dbg, zfrom_dbg, sl, pos, overlaps,
+              frame_shape, debug=False, acc=None):
+    """Apply blending weights to a tile and accumulate it into `dest`.
+
+    Parameters
+    ----------
+    dest : :class:`numpy.ndarray`
+        Destination array.
+    slice : :class:`numpy.ndarray`
+        The tile hyperslice. It is modified in place if `debug` is set.
+    index_dbg : str
+        Tile index in the pandas dataframe (used for debugging purposes only).
+    zfrom_dbg : int
+        Starting frame in the original stack (used for debugging purposes
+        only).
+    sl : tuple
+        Tuple of :class:`slice` objects with the slice offset inside a single
+        stack, or `None` if `slice` spans whole frames.
+    pos : list
+        Position of `slice` inside `dest`, in the form ``[Z, Y, X]``.
+    overlaps : :class:`numpy.ndarray`
+        Overlaps with adjacent tiles (see
+        :func:`~zetastitcher.fuser.overlaps.in_z_range`), or `None` if no
+        blending is needed.
+    frame_shape : tuple
+        Shape of a stack plane (XY).
+    debug: bool
+        Whether to overlay debug information (tile edges and numbers).
+    acc : :class:`OverlapAccumulator`
+        If given, weighted contributions within overlaps are accumulated in
+        `acc` rather than in `dest`. This allows `dest` to have an integer
+        dtype.
+    """
 
-        z_from = pos[0]
-        z_to = z_from + slice.shape[0]
+    z_from = pos[0]
+    z_to = z_from + slice.shape[0]
 
-        y_from = pos[1]
-        y_to = y_from + slice.shape[-2]
+    y_from = pos[1]
+    y_to = y_from + slice.shape[-2]
 
-        x_from = pos[2]
-        x_to = x_from + slice.shape[-1]
+    x_from = pos[2]
+    x_to = x_from + slice.shape[-1]
 
-        if overlaps is not None:
-            z = np.array(flatten(overlaps[['Z_from', 'Z_to']].values))
-            z = np.unique(z)
-            z = np.sort(z)
+    output_roi_index = np.index_exp[z_from:z_to, ..., y_from:y_to,
+                                    x_from:x_to]
 
-            xy_weights = squircle_alpha(*frame_shape)
+    if overlaps is None:
+        if debug:
+            overlay_debug(slice, index_dbg, zfrom_dbg)
+            overlay_edges(slice, sl, frame_shape)
+        dest[output_roi_index] += slice
+        return
+
+    # Split the slice along Z in intervals with the same overlapping tiles,
+    # then split each frame into regions inside and outside the overlaps.
+    # Weights are applied only within overlaps, whereas frames are copied
+    # as they are elsewhere.
+    pieces = []
+    for zfrom, zto in z_intervals(overlaps, slice.shape[0]):
+        rects = active_overlaps(overlaps, zfrom, zto)
+        inside, outside = overlap_regions(tuple(frame_shape), rects)
+
+        if inside:
+            factor = normalization_factor(tuple(frame_shape), rects)
+
+        local_inside = []
+        for region in inside:
+            local, factor_index = _local_region(region, sl, slice.shape)
+            if local is not None:
+                local_inside.append((local, factor[factor_index]))
+
+        local_outside = []
+        for region in outside:
+            local, _ = _local_region(region, sl, slice.shape)
+            if local is not None:
+                local_outside.append(local)
+
+        pieces.append((zfrom, zto, local_inside, local_outside))
+
+    if debug:
+        for zfrom, zto, local_inside, _ in pieces:
+            for local, f in local_inside:
+                slice[np.index_exp[zfrom:zto, ...] + local] *= f
+        overlay_debug(slice, index_dbg, zfrom_dbg)
+        overlay_edges(slice, sl, frame_shape)
+        dest[output_roi_index] += slice
+        return
+
+    def index_pair(zfrom, zto, local):
+        ly, lx = local
+        src = np.index_exp[zfrom:zto, ...] + local
+        dst = np.index_exp[z_from + zfrom:z_from + zto, ...,
+                           y_from + ly.start:y_from + ly.stop,
+                           x_from + lx.start:x_from + lx.stop]
+        return dst, src
+
+    for zfrom, zto, local_inside, local_outside in pieces:
+        for local, f in local_inside:
+            dst, src = index_pair(zfrom, zto, local)
+            weighted = slice[src] * f
+            if acc is None:
+                dest[dst] += weighted
+            else:
+                acc.add(dst, weighted)
+        # no other tile contributes outside of the overlaps
+        for local in local_outside:
+            dst, src = index_pair(zfrom, zto, local)
+            dest[dst] = slice[src]
+
+
+def z_intervals(overlaps, nz):
+    """Split [0, `nz`) in intervals where the set of overlapping tiles is
+    constant.
 
-            z_list = list(zip(z, z[1::]))
-            try:
-                z_list += [(z[-1], None)]
-            except IndexError:
-                pass
+    Parameters
+    ----------
+    overlaps : :class:`numpy.ndarray`
+        Overlap records (see :func:`~zetastitcher.fuser.overlaps.in_z_range`),
+        with `Z_from` and `Z_to` relative to the first frame of the slice.
+    nz : int
+        Number of frames in the slice.
+
+    Returns
+    -------
+    list
+        A list of ``(zfrom, zto)`` tuples.
+    """
+    z = np.unique(np.concatenate([overlaps['Z_from'], overlaps['Z_to']]))
+    z = z[(z > 0) & (z < nz)]
+    z = [0] + [int(x) for x in z] + [nz]
+    return [(zfrom, zto) for zfrom, zto in zip(z, z[1:]) if zfrom < zto]
 
-            for zfrom, zto in z_list:
-                sums = np.copy(xy_weights)
-                condition = (overlaps['Z_from'] <= zfrom)
-                if zto is not None:
-                    condition = condition & (zto <= (overlaps['Z_to']))
-                else:
-                    condition = condition & (overlaps['Z_to'] >= z_to)
 
-                for _, row in overlaps[condition].iterrows():
-                    width = row.X_to - row.X_from
-                    height = row.Y_to - row.Y_from
-                    area = width * height
-                    if not area:
-                        continue
+def active_overlaps(overlaps, zfrom, zto):
+    """Overlapping regions (with nonzero area) covering frames [`zfrom`,
+    `zto`), as a tuple of ``(Y_from, Y_to, X_from, X_to)``."""
+    condition = (overlaps['Z_from'] <= zfrom) & (zto <= overlaps['Z_to'])
 
-                    w = squircle_alpha(*frame_shape)[:height, :width]
+    rects = []
+    for row in overlaps[condition]:
+        width = row['X_to'] - row['X_from']
+        height = row['Y_to'] - row['Y_from']
+        area = width * height
+        if not area:
+            continue
+        rects.append((int(row['Y_from']), int(row['Y_to']),
+                      int(row['X_from']), int(row['X_to'])))
+    return tuple(rects)
 
-                    if row.X_from == 0:
-                        w = np.fliplr(w)
-                    if row.Y_from == 0:
-                        w = np.flipud(w)
 
-                    xy_index = np.index_exp[row.Y_from:row.Y_to,
-                                            row.X_from:row.X_to]
-                    sums[xy_index] += w
+@lru_cache(maxsize=1024)
+def overlap_regions(frame_shape, rects):
+    """Split a frame in disjoint regions inside and outside `rects`.
+
+    Parameters
+    ----------
+    frame_shape : tuple
+        Shape of a stack plane (XY).
+    rects : tuple
+        Overlapping regions in the form ``(Y_from, Y_to, X_from, X_to)``.
+        They may intersect each other (e.g. corners and sides).
+
+    Returns
+    -------
+    tuple
+        Two lists of ``(Y_from, Y_to, X_from, X_to)`` regions: the first
+        one covers the union of `rects`, the second one the rest of the
+        frame.
+    """
+    height, width = frame_shape
+    ys = {0, height}
+    for r in rects:
+        ys.update([min(max(r[0], 0), height), min(max(r[1], 0), height)])
+    ys = sorted(ys)
+
+    inside = []
+    outside = []
+    for y0, y1 in zip(ys, ys[1:]):
+        xs = sorted((r[2], r[3]) for r in rects if r[0] <= y0 and r[1] >= y1)
+
+        x = 0
+        for x0, x1 in xs:
+            x0 = max(x0, x)
+            x1 = min(x1, width)
+            if x0 >= x1:
+                continue
+            if x0 > x:
+                outside.append((y0, y1, x, x0))
+            inside.append((y0, y1, x0, x1))
+            x = x1
+        if x < width:
+            outside.append((y0, y1, x, width))
+
+    return inside, outside
+
+
+def _local_region(region, sl, shape):
+    """Map a region in frame coordinates to an index in a (possibly
+    cropped and strided) slice.
+
+    Returns
+    -------
+    tuple
+        ``(local_index, frame_index)``, where `local_index` is a tuple of
+        (Y, X) :class:`slice` objects indexing the slice and `frame_index`
+        indexes the same pixels in a whole frame. ``(None, None)`` if the
+        region lies outside the slice.
+    """
+    local = []
+    frame = []
+    for a_from, a_to, s, n in [(region[0], region[1], sl and sl[-2],
+                                shape[-2]),
+                               (region[2], region[3], sl and sl[-1],
+                                shape[-1])]:
+        start = 0 if s is None or s.start is None else s.start
+        step = 1 if s is None or s.step is None else s.step
+        k0 = max(0, -(-(a_from - start) // step))
+        k1 = min(n, -(-(a_to - start) // step))
+        if k0 >= k1:
+            return None, None
+        local.append(np.s_[k0:k1])
+        frame.append(np.s_[start + k0 * step:start + (k1 - 1) * step + 1:step])
+    return tuple(local), tuple(frame)
+
+
+class OverlapAccumulator(object):
+    """Float accumulator for the regions of `dest` shared by multiple tiles.
+
+    `dest` is split in cells along the edges of the tiles. Weighted tile
+    contributions falling in cells covered by more than one tile are summed
+    in float32 buffers, which are converted to the dtype of `dest` by
+    :meth:`flush`. Contributions falling elsewhere are written to `dest`
+    directly. This way, `dest` can have the (integer) dtype of the input
+    tiles, and float buffers are needed only for the overlaps.
+    """
+    def __init__(self, dest, boxes):
+        """
+        Parameters
+        ----------
+        dest : :class:`numpy.ndarray`
+            Destination array.
+        boxes : list
+            Tile extents in `dest` coordinates, in the form ``[z_from, z_to,
+            y_from, y_to, x_from, x_to]``.
+        """
+        self.dest = dest
+
+        shape = [dest.shape[0], dest.shape[-2], dest.shape[-1]]
+        boxes = np.clip(np.array(boxes, dtype=int).reshape(-1, 6), 0,
+                        np.repeat(shape, 2))
+
+        self.edges = []
+        for axis in range(0, 3):
+            e = np.unique(np.concatenate(
+                [[0, shape[axis]], boxes[:, 2 * axis:2 * axis + 2].ravel()]))
+            self.edges.append(e)
+
+        count = np.zeros([len(e) - 1 for e in self.edges], dtype=int)
+        for box in boxes:
+            count[tuple(
+                np.s_[np.searchsorted(e, box[2 * i]):
+                      np.searchsorted(e, box[2 * i + 1])]
+                for i, e in enumerate(self.edges))] += 1
+
+        self.cells = {}
+        for cell in zip(*np.nonzero(count > 1)):
+            z, y, x = self._cell_extent(cell)
+            self.cells[cell] = np.zeros(
+                (z[1] - z[0],) + dest.shape[1:-2] + (y[1] - y[0], x[1] - x[0]),
+                dtype=np.float32)
+
+    def _cell_extent(self, cell):
+        return [(e[i], e[i + 1]) for e, i in zip(self.edges, cell)]
+
+    def add(self, index, data):
+        """Accumulate `data` into `dest[index]`.
+
+        Parameters
+        ----------
+        index : tuple
+            Tuple in the form ``(z, ..., y, x)`` of :class:`slice` objects
+            with unit step, in `dest` coordinates.
+        data : :class:`numpy.ndarray`
+        """
+        ranges = [index[0], index[-2], index[-1]]
+
+        spans = []
+        for r, e in zip(ranges, self.edges):
+            spans.append(range(np.searchsorted(e, r.start, side='right') - 1,
+                               np.searchsorted(e, r.stop, side='left')))
+
+        for cell in itertools.product(*spans):
+            extent = [(max(r.start, c[0]), min(r.stop, c[1])) for r, c in
+                      zip(ranges, self._cell_extent(cell))]
+            if any(a >= b for a, b in extent):
+                continue
+
+            (z0, z1), (y0, y1), (x0, x1) = extent
+            src = np.index_exp[
+                z0 - ranges[0].start:z1 - ranges[0].start, ...,
+                y0 - ranges[1].start:y1 - ranges[1].start,
+                x0 - ranges[2].start:x1 - ranges[2].start]
 
-                if zto is None:
-                    slice_index = np.index_exp[zfrom:, ...]
-                else:
-                    slice_index = np.index_exp[zfrom:zto, ...]
+            try:
+                buf = self.cells[cell]
+            except KeyError:
+                self.dest[z0:z1, ..., y0:y1, x0:x1] = to_dtype(
+                    data[src], self.dest.dtype)
+                continue
 
-                with np.errstate(invalid='ignore'):
-                    factor = xy_weights / sums
+            (cz, _), (cy, _), (cx, _) = self._cell_extent(cell)
+            buf[z0 - cz:z1 - cz, ..., y0 - cy:y1 - cy, x0 - cx:x1 - cx] += \
+                data[src]
 
-                if sl is not None:
-                    factor = factor[sl[-2::]]
+    def flush(self):
+        """Write the accumulated overlaps to `dest`."""
+        for cell, buf in self.cells.items():
+            (z0, z1), (y0, y1), (x0, x1) = self._cell_extent(cell)
+            self.dest[z0:z1, ..., y0:y1, x0:x1] = to_dtype(buf,
+                                                           self.dest.dtype)
+        self.cells = {}
 
-                slice[slice_index] *= factor
 
-        if debug:
-            overlay_debug(slice, index_dbg, zfrom_dbg)
-            slice[..., -2:, :] = 65000
-            slice[..., -2:] = 65000
+def overlay_edges(slice, sl, frame_shape):
+    """Mark the bottom and right edges (2 pixels wide) of a tile.
 
-        output_roi_index = np.index_exp[z_from:z_to, ..., y_from:y_to,
-                                        x_from:x_to]
-        dest[output_roi_index] += slice
+    Parameters
+    ----------
+    slice : :class:`numpy.ndarray`
+        The tile hyperslice, modified in place.
+    sl : tuple
+        Tuple of :class:`slice` objects with the slice offset inside the
+        tile, or `None` if `slice` spans whole frames. Only the edges of the
+        tile falling within `slice` are marked.
+    frame_shape : tuple
+        Shape of a tile plane (XY).
+    """
+    value = 65000
+    if np.issubdtype(slice.dtype, np.integer):
+        value = min(value, np.iinfo(slice.dtype).max)
 
-        q.task_done()
+    for axis, size in zip([-2, -1], frame_shape):
+        s = np.s_[:] if sl is None else sl[axis]
+        pixels = range(*s.indices(size))
+        edge = [k for k, p in enumerate(pixels) if p >= size - 2]
+        if not edge:
+            continue
+        index = [np.s_[:]] * slice.ndim
+        index[axis] = edge
+        slice[tuple(index)] = value
 
 
 def overlay_debug(slice, index, z_from):
@@ -196,7 +617,7 @@ def overlay_debug(slice, index, z_from):
             x_end = x + canvas_shape[1]
             ie = np.index_exp[f, ..., cy:cy + canvas_shape[0], x:x_end]
             if len(slice.shape) <= 3:
-                ie = list(ie)[1::]
+                ie = ie[1::]
             try:
                 slice[ie] = numbers[int(l)]
             except ValueError:
@@ -1,18 +1,25 @@
+import math
 import logging
 import os.path
-import threading
 
-from queue import Queue
-from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 
 import psutil
 import numpy as np
 import skimage.external.tifffile as tiff
 
-from .overlaps import Overlaps
-from .fuse import fuse_queue, to_dtype
+from .overlaps import Overlaps, in_z_range
+from .fuse import fuse_tile, to_dtype, OverlapAccumulator
+from .fuse import NORMALIZATION_CACHE_SIZE
 
-from ..io.inputfile import InputFile
+from ..io.inputfilepool import InputFilePool
+from ..io.tileindex import TileIndex
+from ..io.virtual_fused_volume import VirtualFusedVolume
+
+try:
+    from ..io.zarrwriter import ZarrPyramidWriter
+except ImportError:
+    pass
 
 
 logger = logging.getLogger(__name__)
@@ -29,28 +36,63 @@ class FuseRunner(object):
         self.debug = False
         self.output_filename = None
         self.channel = -1
-
-        self._is_multichannel = None
+        self.n_of_threads = 1
+        self.pyramid_levels = 4
+
+        self.full_resolution = True
+        """Whether to store the full resolution level (.zarr output only).
+        If `False`, only the downsampled levels are stored."""
+
+        self.max_memory = None
+        """Memory budget in bytes. If set, output chunks are sized so that
+        the output buffers and the tile buffers being fused fit within this
+        budget. Otherwise, chunks are sized according to the available
+        memory."""
+
+        self.mip = None
+        """If set to one of
+        :data:`~zetastitcher.io.virtual_fused_volume.PROJECTIONS`, save the
+        projection along Z of the volume (a single frame) instead of the
+        volume itself. Tiles are projected one by one and blended in 2D (see
+        :meth:`VirtualFusedVolume.projection`), without fusing the
+        volume."""
+
+        self.max_open_files = None
+        """Maximum number of tiles kept open across output chunks. If
+        `None`, all tiles are kept open, so that each tile is opened only
+        once. This takes at least one file descriptor per tile (and one per
+        decoding thread for readers decoding frames concurrently): lower it
+        if the limit on open files is exceeded, at the cost of reopening
+        tiles at every chunk."""
+
+        self.block_shape = None
+        """Shape (Z, Y, X) of the blocks fused in parallel. A `None` element
+        means the whole output extent along that axis. If `None`, each chunk
+        of the output is split along Z in :attr:`n_of_threads` blocks."""
+
+        # volume metadata, without opening any file
+        self._dtype, self._nchannels = self.fm.tile_metadata()
 
     @property
-    @lru_cache()
     def dtype(self):
-        infile = os.path.join(self.path, self.fm.data_frame.iloc[0].name)
-        with InputFile(infile) as f:
-            return np.dtype(f.dtype)
+        return self._dtype
 
     @property
-    @lru_cache()
     def is_multichannel(self):
-        if self.channel != -1:
-            return False
-        infile = os.path.join(self.path, self.fm.data_frame.iloc[0].name)
-        with InputFile(infile) as f:
-            if f.nchannels > 1:
-                multichannel = True
-            else:
-                multichannel = False
-        return multichannel
+        return self.channel == -1 and self._nchannels > 1
+
+    @property
+    def fused_dtype(self):
+        """Dtype of the output buffers.
+
+        For integer data, tiles are fused directly in their own dtype: float
+        accumulation is used only within overlaps (see
+        :class:`~zetastitcher.fuser.fuse.OverlapAccumulator`). Otherwise, and
+        when overlaying debug information, float32 is used.
+        """
+        if np.issubdtype(self.dtype, np.integer) and not self.debug:
+            return self.dtype
+        return np.dtype(np.float32)
 
     @property
     def output_shape(self):
@@ -59,29 +101,34 @@ class FuseRunner(object):
             thickness -= (thickness - self.zmax)
         thickness -= self.zmin
 
-        infile = os.path.join(self.path, self.fm.data_frame.iloc[0].name)
-        with InputFile(infile) as f:
-            f.channel = self.channel
-            output_shape = list(f.shape)
-
-        output_shape[0] = thickness
-        output_shape[-2] = self.fm.full_height
-        output_shape[-1] = self.fm.full_width
+        output_shape = [thickness, self.fm.full_height, self.fm.full_width]
+        if self.is_multichannel:
+            output_shape.insert(1, self._nchannels)
 
         return tuple(output_shape)
 
     def run(self):
+        if self.mip is not None:
+            self._run_projection()
+            return
+
         ov = Overlaps(self.fm)
 
         total_byte_size = np.asscalar(np.prod(self.output_shape)
                                       * self.dtype.itemsize)
         bigtiff = total_byte_size > 2**31 - 1
 
-        ram = psutil.virtual_memory().available
+        if self.max_memory is None:
+            ram = psutil.virtual_memory().available
 
-        # size in bytes of an xy plane (including channels) (float32)
-        xy_size = np.asscalar(np.prod(self.output_shape[1::]) * 4)
-        n_frames_in_ram = int(ram / xy_size / 1.5)
+            # size in bytes of an xy plane (including channels)
+            xy_size = np.asscalar(np.prod(self.output_shape[1::])
+                                  * self.fused_dtype.itemsize)
+            n_frames_in_ram = int(ram / xy_size / 1.5)
+        else:
+            n_frames_in_ram = self._frames_in_budget(ov)
+        n_frames_in_ram = max(1, min(n_frames_in_ram, self.output_shape[0]))
+        logger.info('fusing {} frames at a time'.format(n_frames_in_ram))
 
         n_loops = self.output_shape[0] // n_frames_in_ram
 
@@ -90,76 +137,278 @@ class FuseRunner(object):
         if remainder:
             partial_thickness += [remainder]
 
-        try:
-            os.remove(self.output_filename)
-        except FileNotFoundError:
-            pass
-
-        infile = os.path.join(self.path, self.fm.data_frame.iloc[0].name)
-        with InputFile(infile) as f:
-            f.channel = self.channel
-            frame_shape = list(f.shape)[-2::]
-
-        for thickness in partial_thickness:
-            self.zmax = self.zmin + thickness
-            fused = np.zeros(self.output_shape, dtype=np.float32)
-            q = Queue(maxsize=20)
-
-            t = threading.Thread(target=fuse_queue,
-                                 args=(q, fused, frame_shape, self.debug))
-            t.start()
-
-            for index, row in self.fm.data_frame.iterrows():
-                if self.zmax is None:
-                    z_to = row.nfrms
-                else:
-                    z_to = self.zmax - row.Zs
-
-                if z_to > row.nfrms:
-                    z_to = row.nfrms
-
-                if z_to <= 0:
-                    continue
+        writer = self._open_writer(self.output_shape)
 
-                z_from = self.zmin - row.Zs
+        first = self.fm.data_frame.iloc[0]
+        frame_shape = [int(first['ysize']), int(first['xsize'])]
 
-                if z_from < 0:
-                    z_from = 0
+        # kept across chunks: tiles are opened only once
+        self._build_schedule()
+        max_open = self.max_open_files
+        if max_open is None:
+            max_open = len(self.fm.data_frame)
+        self._pool = InputFilePool(max_open=max_open)
 
-                if z_from >= z_to:
-                    continue
-
-                with InputFile(os.path.join(self.path, index)) as f:
-                    f.channel = self.channel
-                    logger.info(
-                        'loading {}\tz=[{}:{}]'.format(index, z_from, z_to))
-                    zslice = f.zslice(
-                        z_from, z_to, dtype=np.float32, copy=True)
-
-                top_left = [row.Zs + z_from - self.zmin, row.Ys, row.Xs]
-                overlaps = ov[index].copy()
-                overlaps = overlaps.loc[
-                    (overlaps['Z_from'] <= z_to) & (overlaps['Z_to'] >= z_from)
-                ]
-
-                overlaps['Z_from'] -= z_from
-                overlaps['Z_to'] -= z_from
-
-                overlaps.loc[overlaps['Z_from'] < 0, 'Z_from'] = 0
-
-                q.put([zslice, index, z_from, None, top_left, overlaps])
+        try:
+            self._run(ov, partial_thickness, frame_shape, writer, bigtiff)
+        finally:
+            self._pool.close()
 
-            q.put(None)  # close queue
+        if writer is not None:
+            writer.close()
 
-            t.join()  # wait for fuse thread to finish
+    def _run(self, ov, partial_thickness, frame_shape, writer, bigtiff):
+        for thickness in partial_thickness:
+            self.zmax = self.zmin + thickness
+            fused = np.zeros(self.output_shape, dtype=self.fused_dtype)
+
+            blocks = self._blocks(fused.shape)
+            n_of_workers = min(self.n_of_threads, len(blocks))
+            read_threads = max(1, self.n_of_threads // len(blocks))
+
+            def fuse_block(block):
+                self._fuse_block(fused, block, ov, frame_shape, read_threads)
+
+            # blocks are sorted along Z: frames are written as soon as all
+            # the blocks spanning them have been fused
+            with ThreadPoolExecutor(max_workers=n_of_workers) as executor:
+                for i, _ in enumerate(executor.map(fuse_block, blocks)):
+                    z_from, z_to = blocks[i][:2]
+                    if i + 1 < len(blocks) and blocks[i + 1][:2] == [
+                            z_from, z_to]:
+                        continue
+                    self._write(fused[z_from:z_to], writer, bigtiff)
             print('=================================')
 
+            self.zmin += thickness
+
+    def _run_projection(self):
+        vfv = VirtualFusedVolume(self.fm)
+        vfv.n_of_threads = self.n_of_threads
+        vfv.overlay_debug_enabled = self.debug
+
+        logger.info('computing {} projection'.format(self.mip))
+        with vfv:
+            p = vfv.projection(self.mip, self.zmin, self.zmax, self.channel)
+
+        # saved as a volume with a single frame
+        p = p[np.newaxis]
+        writer = self._open_writer(p.shape)
+        self._write(p, writer, bigtiff=p.nbytes > 2**31 - 1)
+        if writer is not None:
+            writer.close()
+
+    def _open_writer(self, output_shape):
+        """Writer of the output volume (ZCYX), or `None` for tiff output."""
+        if self.output_filename.endswith('.zarr'):
+            shape = list(output_shape)
             if self.is_multichannel:
-                fused = np.moveaxis(fused, -3, -1)
+                shape.append(shape.pop(-3))
+            try:
+                return ZarrPyramidWriter(
+                    self.output_filename, shape, self.dtype,
+                    levels=self.pyramid_levels,
+                    full_resolution=self.full_resolution)
+            except NameError:
+                raise ValueError('zarr output requires the zarr package')
 
-            fused = to_dtype(fused, self.dtype)
-            logger.info('saving output to {}'.format(self.output_filename))
+        try:
+            os.remove(self.output_filename)
+        except FileNotFoundError:
+            pass
+        return None
+
+    def _build_schedule(self):
+        """Index tiles, in order to quickly find the tiles intersecting a
+        given block."""
+        df = self.fm.data_frame
+        self._tiles = list(df.itertuples())
+        self._tiles_zs = df['Zs'].values
+        self._tile_index = TileIndex(df)
+
+    def _tiles_in_block(self, Z_from, Z_to, y_from, y_to, x_from, x_to):
+        """Tiles intersecting the given block (absolute coordinates), sorted
+        by Zs."""
+        positions = self._tile_index.query(Z_from, Z_to, y_from, y_to,
+                                           x_from, x_to)
+        # stable sort: fusion order (and float rounding) is the same as
+        # when tiles were looked up in order of Zs
+        positions = positions[np.argsort(self._tiles_zs[positions],
+                                         kind='mergesort')]
+        return [self._tiles[i] for i in positions]
+
+    def _overlap_fraction(self, ov):
+        """Upper bound on the fraction of an output frame covered by more
+        than one tile.
+
+        Pixels covered by several tiles lie within the overlap of at least
+        two adjacent tiles, therefore the area of the overlaps of each tile
+        with its neighbours (see :class:`Overlaps`) is summed, counting each
+        pair of tiles once.
+        """
+        o = ov.overlaps
+        area = (o[..., 3] - o[..., 2]) * (o[..., 5] - o[..., 4])
+        fraction = area.sum() / 2 / (self.fm.full_height
+                                     * self.fm.full_width)
+        return min(float(fraction), 1.)
+
+    def _frames_in_budget(self, ov):
+        """Number of output frames that can be fused within
+        :attr:`max_memory`.
+
+        For each output frame, account for the output buffer (see
+        :attr:`fused_dtype`), its conversion to the output dtype and the tile
+        buffers being read and fused (raw and float32) by the workers. When
+        fusing integer data, the float32 buffers of
+        :class:`~zetastitcher.fuser.fuse.OverlapAccumulator` are accounted
+        for over the pixels covered by more than one tile (see
+        :meth:`_overlap_fraction`). The
+        normalization factors cached by
+        :func:`~zetastitcher.fuser.fuse.normalization_factor` are accounted
+        for as one float32 tile frame per tile, up to
+        :data:`~zetastitcher.fuser.fuse.NORMALIZATION_CACHE_SIZE`.
+
+        Memory held by open tile handles is not accounted for: this includes
+        the handles kept by :class:`InputFilePool` and the per-thread handles
+        of readers decoding frames concurrently, whose size depends on the
+        file format (e.g. TIFF page indices, zip directories).
+        """
+        output_shape = self.output_shape
+        out_frame = np.prod(output_shape[1:])
+        n_channels = out_frame // (output_shape[-2] * output_shape[-1])
+
+        df = self.fm.data_frame
+        tile_frame = (df['ysize'] * df['xsize']).max() * n_channels
+
+        itemsize = self.dtype.itemsize
+        fused_itemsize = self.fused_dtype.itemsize
+        if fused_itemsize == itemsize:
+            out_bytes = out_frame * itemsize
+        else:
+            out_bytes = out_frame * (fused_itemsize + itemsize)
+        frame_bytes = out_bytes + tile_frame * (4 + itemsize)
+        if np.issubdtype(self.fused_dtype, np.integer):
+            frame_bytes += math.ceil(out_frame * self._overlap_fraction(ov)
+                                     * 4)
+
+        factor_bytes = (df['ysize'] * df['xsize']).max() * 4
+        cache_bytes = min(NORMALIZATION_CACHE_SIZE, len(df) * factor_bytes)
+
+        n_frames = int((self.max_memory - cache_bytes) // frame_bytes)
+        if n_frames < 1:
+            logger.warning('memory budget of {} bytes is too small, at least '
+                           '{} bytes are needed'.format(
+                               self.max_memory, cache_bytes + frame_bytes))
+        return n_frames
+
+    def _write(self, fused, writer, bigtiff):
+        if self.is_multichannel:
+            fused = np.moveaxis(fused, -3, -1)
+
+        fused = to_dtype(fused, self.dtype)
+        logger.info('saving output to {}'.format(self.output_filename))
+        if writer is not None:
+            writer.write(fused)
+        else:
+            # without an explicit photometric interpretation, blocks of 3 or
+            # 4 frames would be written as a single RGB(A) page
+            if self.is_multichannel:
+                rgb = fused.shape[-1] in [3, 4]
+                kwargs = dict(photometric='rgb' if rgb else 'minisblack',
+                              planarconfig='contig')
+            else:
+                kwargs = dict(photometric='minisblack')
             tiff.imsave(self.output_filename, fused, append=True,
-                        bigtiff=bigtiff)
-
-            self.zmin += thickness
+                        bigtiff=bigtiff, **kwargs)
+
+    def _blocks(self, shape):
+        """Split an output chunk of the given shape in independent blocks.
+
+        Returns
+        -------
+        list
+            A list of blocks in the form ``[z_from, z_to, y_from, y_to,
+            x_from, x_to]`` (output coordinates, relative to the chunk).
+        """
+        extent = [shape[0], shape[-2], shape[-1]]
+        if self.block_shape is None:
+            block_shape = [math.ceil(extent[0] / self.n_of_threads), None,
+                           None]
+        else:
+            block_shape = list(self.block_shape)
+
+        ranges = []
+        for e, b in zip(extent, block_shape):
+            if b is None or b <= 0:
+                b = e
+            ranges.append([(i, min(i + b, e)) for i in range(0, e, b)])
+
+        blocks = []
+        for z in ranges[0]:
+            for y in ranges[1]:
+                for x in ranges[2]:
+                    blocks.append(list(z) + list(y) + list(x))
+        return blocks
+
+    def _fuse_block(self, fused, block, ov, frame_shape, read_threads=1):
+        """Fuse all tiles contributing to `block` into `fused`.
+
+        Parameters
+        ----------
+        fused : :class:`numpy.ndarray`
+            Output chunk, starting at frame :attr:`zmin`.
+        block : list
+            Block extent in the form returned by :meth:`_blocks`.
+        ov : :class:`Overlaps`
+        frame_shape : tuple
+            Shape of a stack plane (XY).
+        read_threads : int
+            Number of threads used for decoding each tile.
+        """
+        bz_from, bz_to, by_from, by_to, bx_from, bx_to = block
+        dest = fused[bz_from:bz_to, ..., by_from:by_to, bx_from:bx_to]
+
+        # block extent in absolute coordinates
+        Z_from = self.zmin + bz_from
+        Z_to = self.zmin + bz_to
+
+        tiles = self._tiles_in_block(Z_from, Z_to, by_from, by_to, bx_from,
+                                     bx_to)
+
+        if fused.dtype == np.float32:
+            acc = None
+        else:
+            acc = OverlapAccumulator(dest, [
+                [row.Zs - Z_from, row.Zs + row.nfrms - Z_from,
+                 row.Ys - by_from, row.Ys + row.ysize - by_from,
+                 row.Xs - bx_from, row.Xs + row.xsize - bx_from]
+                for row in tiles])
+
+        for row in tiles:
+            index = row.Index
+            z_from = max(Z_from - row.Zs, 0)
+            z_to = min(Z_to - row.Zs, row.nfrms)
+            y_from = max(by_from - row.Ys, 0)
+            y_to = min(by_to - row.Ys, row.ysize)
+            x_from = max(bx_from - row.Xs, 0)
+            x_to = min(bx_to - row.Xs, row.xsize)
+
+            with self._pool.get(os.path.join(self.path, index)) as f:
+                f.channel = self.channel
+                f.n_of_threads = read_threads
+                logger.info(
+                    'loading {}\tz=[{}:{}]'.format(index, z_from, z_to))
+                zslice = f.zslice(z_from, z_to, dtype=fused.dtype, copy=True)
+
+            sl = np.index_exp[z_from:z_to, y_from:y_to, x_from:x_to]
+            zslice = zslice[..., y_from:y_to, x_from:x_to]
+
+            top_left = [row.Zs + z_from - Z_from, row.Ys + y_from - by_from,
+                        row.Xs + x_from - bx_from]
+            overlaps = in_z_range(ov[index], z_from, z_to)
+
+            fuse_tile(dest, zslice, index, z_from, sl, top_left, overlaps,
+                      frame_shape, self.debug, acc)
+
+        if acc is not None:
+            acc.flush()
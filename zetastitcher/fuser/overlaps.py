@@ -1,132 +1,147 @@
+import numpy as np
 import pandas as pd
 
 
+DIRECTIONS = ['n', 's', 'e', 'w', 'nw', 'ne', 'sw', 'se']
+"""Neighbour directions, in the order used along the second axis of
+:attr:`Overlaps.overlaps`."""
+
+OFFSETS = [(-1, 0), (1, 0), (0, 1), (0, -1), (-1, -1), (-1, 1), (1, -1),
+           (1, 1)]
+"""Grid offsets (j, i) of the neighbours in :data:`DIRECTIONS`."""
+
+COLUMNS = ['Z_from', 'Z_to', 'Y_from', 'Y_to', 'X_from', 'X_to']
+
+OVERLAP_DTYPE = np.dtype([(c, int) for c in COLUMNS])
+"""Dtype of the per-tile overlap records returned by
+:meth:`Overlaps.__getitem__`."""
+
+
+def in_z_range(overlaps, z_from, z_to):
+    """Select overlaps intersecting frames [`z_from`, `z_to`].
+
+    Parameters
+    ----------
+    overlaps : :class:`numpy.ndarray`
+        Overlap records of a tile, as returned by :meth:`Overlaps.__getitem__`.
+    z_from : int
+    z_to : int
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        A (writable) copy of the selected records, with `Z_from` and `Z_to`
+        relative to `z_from` (`Z_from` is clipped at 0).
+    """
+    ov = overlaps[(overlaps['Z_from'] <= z_to) & (overlaps['Z_to'] >= z_from)]
+    ov['Z_from'] -= z_from
+    ov['Z_to'] -= z_from
+    np.maximum(ov['Z_from'], 0, out=ov['Z_from'])
+    return ov
+
+
 class Overlaps(object):
+    """Overlaps of each tile with its 8 neighbours in the tile grid.
+
+    Overlaps are stored in :attr:`overlaps`, an int array of shape
+    (`n_tiles`, 8, 6). Tiles are in the same order as in
+    :attr:`FileMatrix.data_frame`, neighbours are in the order given by
+    :data:`DIRECTIONS` and the last axis holds :data:`COLUMNS`, in tile
+    coordinates. Rows are zero for missing or non-overlapping neighbours.
+
+    Indexing by tile name returns the overlaps of that tile as a read-only
+    record array of length 8 (see :data:`OVERLAP_DTYPE`), precomputed once.
+    """
     def __init__(self, filematrix):
         self.fm = filematrix
 
-        self.overlap_n = None
-        self.overlap_s = None
-        self.overlap_e = None
-        self.overlap_w = None
-        self.overlap_nw = None
-        self.overlap_ne = None
-        self.overlap_sw = None
-        self.overlap_se = None
+        self.overlaps = None
+        self.tile_index = None  #: tile name -> index along the first axis
+
+        self._records = None
 
         self._compute_overlaps()
 
     def _compute_overlaps(self):
-        def comp_diff(dest, row, other_name):
-            other = fm_df.loc[other_name]
-            temp = pd.Series()
-            temp['Z_from'] = max(other['Zs'], row['Zs']) - row['Zs']
-            temp['Z_to'] = min(other['Zs_end'], row['Zs_end']) - row['Zs']
+        fm_df = self.fm.data_frame
 
-            temp['Y_from'] = max(other['Ys'], row['Ys']) - row['Ys']
-            temp['Y_to'] = min(other['Ys_end'], row['Ys_end']) - row['Ys']
+        self.tile_index = {name: i for i, name in enumerate(fm_df.index)}
 
-            temp['X_from'] = max(other['Xs'], row['Xs']) - row['Xs']
-            temp['X_to'] = min(other['Xs_end'], row['Xs_end']) - row['Xs']
+        # (from, to) pairs along Z, Y, X
+        bbox = fm_df[['Zs', 'Zs_end', 'Ys', 'Ys_end', 'Xs', 'Xs_end']].values
+        bbox = bbox.astype(int).reshape(-1, 3, 2)
 
-            cols_to_zero(dest, row.name)
+        grid = np.vectorize(self.tile_index.__getitem__, otypes=[int])(
+            self.fm.name_array)
+        Ny, Nx = grid.shape
 
-            if temp['Z_from'] > temp['Z_to'] or temp['Y_from'] > temp['Y_to'] \
-                    or temp['X_from'] > temp['X_to']:
-                pass
-            else:
-                dest.loc[row.name] = temp
+        overlaps = np.zeros((len(fm_df), len(DIRECTIONS), 3, 2), dtype=int)
 
-        def cols_to_zero(dest, row_name):
-            cols = ['Z_from', 'Z_to', 'Y_from', 'Y_to', 'X_from', 'X_to']
-            for c in cols:
-                dest.loc[row_name, c] = 0
+        for d, (dj, di) in enumerate(OFFSETS):
+            # grid cells having a neighbour in this direction
+            j = slice(max(0, -dj), Ny - max(0, dj))
+            i = slice(max(0, -di), Nx - max(0, di))
+            nj = slice(j.start + dj, j.stop + dj)
+            ni = slice(i.start + di, i.stop + di)
 
-        fm_df = self.fm.data_frame
+            tiles = grid[j, i].ravel()
+            others = grid[nj, ni].ravel()
+
+            row = bbox[tiles]
+            other = bbox[others]
+            start = row[..., 0:1]
+
+            ov = np.empty_like(row)
+            ov[..., 0] = np.maximum(other[..., 0], row[..., 0])
+            ov[..., 1] = np.minimum(other[..., 1], row[..., 1])
+            ov -= start
+
+            valid = np.all(ov[..., 0] <= ov[..., 1], axis=-1)
+            overlaps[tiles[valid], d] = ov[valid]
+
+        self.overlaps = overlaps.reshape(len(fm_df), len(DIRECTIONS), 6)
+        self.overlaps.setflags(write=False)
+
+        self._records = np.ascontiguousarray(self.overlaps).view(
+            OVERLAP_DTYPE)[..., 0]
+        self._records.setflags(write=False)
+
+    def _direction_frame(self, direction):
+        d = DIRECTIONS.index(direction)
+        return pd.DataFrame(self.overlaps[:, d],
+                            index=self.fm.data_frame.index, columns=COLUMNS)
+
+    @property
+    def overlap_n(self):
+        return self._direction_frame('n')
+
+    @property
+    def overlap_s(self):
+        return self._direction_frame('s')
+
+    @property
+    def overlap_e(self):
+        return self._direction_frame('e')
+
+    @property
+    def overlap_w(self):
+        return self._direction_frame('w')
+
+    @property
+    def overlap_nw(self):
+        return self._direction_frame('nw')
+
+    @property
+    def overlap_ne(self):
+        return self._direction_frame('ne')
+
+    @property
+    def overlap_sw(self):
+        return self._direction_frame('sw')
 
-        overlap_n = pd.DataFrame()
-        overlap_s = pd.DataFrame()
-        overlap_e = pd.DataFrame()
-        overlap_w = pd.DataFrame()
-        overlap_nw = pd.DataFrame()
-        overlap_ne = pd.DataFrame()
-        overlap_sw = pd.DataFrame()
-        overlap_se = pd.DataFrame()
-
-        for j in range(0, self.fm.Ny):
-            for i in range(0, self.fm.Nx):
-                row = self.fm.data_frame.loc[self.fm.name_array[j, i]]
-
-                # north
-                if j > 0:
-                    parent = self.fm.name_array[j - 1, i]
-                    comp_diff(overlap_n, row, parent)
-                else:
-                    cols_to_zero(overlap_n, row.name)
-
-                # south
-                if j < self.fm.Ny - 1:
-                    parent = self.fm.name_array[j + 1, i]
-                    comp_diff(overlap_s, row, parent)
-                else:
-                    cols_to_zero(overlap_s, row.name)
-
-                # east
-                if i < self.fm.Nx - 1:
-                    parent = self.fm.name_array[j, i + 1]
-                    comp_diff(overlap_e, row, parent)
-                else:
-                    cols_to_zero(overlap_e, row.name)
-
-                # west
-                if i > 0:
-                    parent = self.fm.name_array[j, i - 1]
-                    comp_diff(overlap_w, row, parent)
-                else:
-                    cols_to_zero(overlap_w, row.name)
-
-                # north-west
-                if i > 0 and j > 0:
-                    parent = self.fm.name_array[j - 1, i - 1]
-                    comp_diff(overlap_nw, row, parent)
-                else:
-                    cols_to_zero(overlap_nw, row.name)
-
-                # north-east
-                if i < self.fm.Nx - 1 and j > 0:
-                    parent = self.fm.name_array[j - 1, i + 1]
-                    comp_diff(overlap_ne, row, parent)
-                else:
-                    cols_to_zero(overlap_ne, row.name)
-
-                # south-west
-                if i > 0 and j < self.fm.Ny - 1:
-                    parent = self.fm.name_array[j + 1, i - 1]
-                    comp_diff(overlap_sw, row, parent)
-                else:
-                    cols_to_zero(overlap_sw, row.name)
-
-                # south-east
-                if i < self.fm.Nx - 1 and j < self.fm.Ny - 1:
-                    parent = self.fm.name_array[j + 1, i + 1]
-                    comp_diff(overlap_se, row, parent)
-                else:
-                    cols_to_zero(overlap_se, row.name)
-
-        self.overlap_n = overlap_n.astype(int)
-        self.overlap_s = overlap_s.astype(int)
-        self.overlap_e = overlap_e.astype(int)
-        self.overlap_w = overlap_w.astype(int)
-        self.overlap_nw = overlap_nw.astype(int)
-        self.overlap_ne = overlap_ne.astype(int)
-        self.overlap_sw = overlap_sw.astype(int)
-        self.overlap_se = overlap_se.astype(int)
+    @property
+    def overlap_se(self):
+        return self._direction_frame('se')
 
     def __getitem__(self, tile_name):
-        df = pd.DataFrame()
-        names = ['n', 's', 'e', 'w', 'nw', 'ne', 'sw', 'se']
-        for n in names:
-            name = 'overlap_' + n
-            overlap = getattr(self, name)
-            df[n] = overlap.loc[tile_name]
-        return df.transpose()
+        return self._records[self.tile_index[tile_name]]
@@ -0,0 +1,111 @@
+"""Build a multiscale overview of the fused volume.
+
+The overview is a Zarr store saved next to the .yml file (see
+:func:`~zetastitcher.io.virtual_fused_volume.overview_path`), holding the
+fused volume downsampled by 2, 4, 8... along Z, Y and X. It is used by
+:class:`~zetastitcher.io.virtual_fused_volume.VirtualFusedVolume` to serve
+strided queries without reading the tiles, as long as the tile positions
+match the ones it was built from (see
+:func:`~zetastitcher.io.virtual_fused_volume.positions_hash`).
+"""
+
+import os.path
+import logging
+import argparse
+
+import zarr
+
+from ..version import __version__
+
+from .utils import CustomFormatter, parse_size
+from .fuse_runner import FuseRunner
+from ..io.filematrix import FileMatrix
+from ..io.virtual_fused_volume import overview_path, positions_hash
+
+logger = logging.getLogger(__name__)
+
+
+def build_overview(fm, levels=4, n_of_threads=8, max_memory=None):
+    """Build the multiscale overview of a stitched volume.
+
+    Parameters
+    ----------
+    fm : :class:`FileMatrix`
+        File matrix loaded from a .yml file, with absolute positions.
+    levels : int
+        Number of downsampled levels.
+    n_of_threads : int
+    max_memory : int
+        Memory budget in bytes, see :attr:`FuseRunner.max_memory`.
+
+    Returns
+    -------
+    str
+        Path of the overview.
+    """
+    for k in ['Xs', 'Ys', 'Zs']:
+        if k not in fm.data_frame.columns:
+            raise ValueError('absolute positions not found, run stitch-fuse '
+                             'first')
+
+    fr = FuseRunner(fm)
+    fr.output_filename = overview_path(fm.input_path)
+    fr.pyramid_levels = levels + 1
+    fr.full_resolution = False
+    fr.n_of_threads = n_of_threads
+    fr.max_memory = max_memory
+
+    logger.info('saving overview to {}'.format(fr.output_filename))
+    fr.run()
+
+    # identifies the positions the overview was built from; stored last, so
+    # that incomplete overviews are not used
+    root = zarr.open_group(fr.output_filename, mode='r+')
+    root.attrs['positions_hash'] = positions_hash(fm)
+
+    return fr.output_filename
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Build a multiscale overview of the fused volume, which '
+                    'is saved next to the .yml file and used to serve '
+                    'strided queries to VirtualFusedVolume.',
+        epilog='Author: Giacomo Mazzamuto <mazzamuto@lens.unifi.it>\n'
+               'Version: {}'.format(__version__),
+        formatter_class=CustomFormatter)
+
+    parser.add_argument(
+        'yml_file',
+        help='.yml file with absolute positions, as produced by stitch-fuse. '
+             'If a directory is specified instead of a file, uses a file '
+             'named "stitch.yml"')
+
+    parser.add_argument('--levels', type=int, default=4,
+                        help='number of downsampled levels (2x, 4x, 8x...)')
+
+    parser.add_argument('-n', type=int, default=8, dest='n_of_threads',
+                        help='number of parallel threads to use for decoding '
+                             'input files')
+
+    parser.add_argument('--max-memory', type=parse_size, dest='max_memory',
+                        help='memory budget for fusion, in bytes or with a '
+                             'K, M, G, T suffix (e.g. 16G). If not specified, '
+                             'use the available memory.')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if os.path.isdir(args.yml_file):
+        args.yml_file = os.path.join(args.yml_file, 'stitch.yml')
+
+    fm = FileMatrix(args.yml_file)
+    build_overview(fm, levels=args.levels, n_of_threads=args.n_of_threads,
+                   max_memory=args.max_memory)
+
+
+if __name__ == '__main__':
+    main()
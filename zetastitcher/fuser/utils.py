@@ -0,0 +1,22 @@
+"""Helpers shared by the command line interfaces of the fuser."""
+
+import argparse
+
+
+class CustomFormatter(argparse.ArgumentDefaultsHelpFormatter,
+                      argparse.RawDescriptionHelpFormatter):
+    pass
+
+
+def parse_size(value):
+    """Parse a size in bytes, with an optional K, M, G or T suffix."""
+    units = {'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+    value = value.strip().upper().rstrip('B')
+    factor = 1
+    if value and value[-1] in units:
+        factor = units[value[-1]]
+        value = value[:-1]
+    try:
+        return int(float(value) * factor)
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid size: {}'.format(value))
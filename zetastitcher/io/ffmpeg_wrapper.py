@@ -3,6 +3,8 @@ import subprocess as sp
 
 import numpy as np
 
+from .utils import reduce_channels, reduced_dtype, reduced_shape
+
 
 class FFMPEGWrapper(object):
     def __init__(self, file_name=None):
@@ -10,6 +12,15 @@ class FFMPEGWrapper(object):
 
         self.proc = None
 
+        self.channel = -1
+        """Channel selected by :meth:`zslice` (-1: all channels, -2: sum of
+        all channels)."""
+
+        self.random_access = False
+        """Frames are decoded sequentially from the beginning of the file,
+        so reading a range of frames costs as much as reading all the frames
+        before it."""
+
         self._probed_dict = None
 
         if file_name is not None:
@@ -92,26 +103,26 @@ class FFMPEGWrapper(object):
 
         dt = np.dtype(self.dtype)
 
+        frame_shape = list(self.shape[1:])
+        frame_bytes = int(np.prod(frame_shape)) * dt.itemsize
+
         i = 0
         while i < start_frame:
-            pipe.stdout.read(self.ysize * self.xsize * dt.itemsize)
+            pipe.stdout.read(frame_bytes)
             i += 1
 
-        shape = list(self.shape)
-        shape[0] = end_frame - start_frame
-
-        a = np.zeros(shape, dtype=self.dtype)
-
-        shape[0] = 1
+        a = np.empty(
+            [end_frame - start_frame]
+            + list(reduced_shape(frame_shape, self.channel)),
+            dtype=reduced_dtype(self.dtype, self.channel, dtype))
 
         while i < end_frame:
-            raw = pipe.stdout.read(np.prod(shape) * dt.itemsize)
-            a[i - start_frame] = \
-                np.fromstring(raw, dtype=self.dtype).reshape(shape)
+            raw = pipe.stdout.read(frame_bytes)
+            frame = np.frombuffer(raw, dtype=self.dtype).reshape(frame_shape)
+            reduce_channels(frame, self.channel, dtype,
+                            out=a[i - start_frame])
             i += 1
 
         pipe.communicate()
 
-        if dtype is None:
-            return a
-        return a.astype(dtype)
+        return a
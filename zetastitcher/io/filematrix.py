@@ -7,6 +7,8 @@ import logging
 import json
 import yaml
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 import networkx as nx
@@ -16,6 +18,10 @@ from .inputfile import InputFile
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
+METADATA_CACHE_FILE_NAME = '.zetastitcher_cache.json'
+"""Name of the sidecar file where tile metadata is cached by
+:meth:`FileMatrix.load_dir`."""
+
 
 def parse_file_name(file_name):
     """Parse fields (stage coordinates) contained in `file_name`.
@@ -55,7 +61,8 @@ def parse_file_name(file_name):
 class FileMatrix:
     """Data structures for a matrix of input files."""
     def __init__(self, input_path=None, ascending_tiles_x=True,
-                 ascending_tiles_y=True, recursive=False):
+                 ascending_tiles_y=True, recursive=False, n_of_threads=8,
+                 use_metadata_cache=True):
         """
         Construct a FileMatrix object from a directory path or a .yml file
         produced by the stitcher. Tile ordering parameters need to be
@@ -70,19 +77,32 @@ class FileMatrix:
             whether tiles are supposed to be read in ascending X order
         ascending_tiles_y : bool
             whether tiles are supposed to be read in ascending Y order
+        recursive : bool
+            whether to look for files recursively
+        n_of_threads : int
+            number of threads used to probe file headers when scanning a
+            directory
+        use_metadata_cache : bool
+            whether to read and update the sidecar metadata cache when
+            scanning a directory, see :meth:`load_dir`
         """
         self.input_path = input_path
 
         self.data_frame = None
         """A :class:`pandas.DataFrame` object. Contains the following
         columns: `X`, `Y`, `Z`, `Z_end`, `xsize`, `ysize`, `nfrms`,
-        `filename`."""
+        `dtype`, `nchannels`, `filename`. `dtype` and `nchannels` may be
+        missing if loaded from a .yml file saved by an older version (see
+        :meth:`tile_metadata`)."""
 
         self.ascending_tiles_x = ascending_tiles_x
         self.ascending_tiles_y = ascending_tiles_y
 
         self.name_array = None
 
+        self.n_of_threads = n_of_threads
+        self.use_metadata_cache = use_metadata_cache
+
         if input_path is None:
             return
 
@@ -94,45 +114,68 @@ class FileMatrix:
     def load_dir(self, dir=None, recursive=False):
         """Look for files in `dir` recursively and populate data structures.
 
+        File headers are probed concurrently using :attr:`n_of_threads`
+        threads. If :attr:`use_metadata_cache` is set, stack sizes are also
+        stored in a sidecar file named :data:`METADATA_CACHE_FILE_NAME`
+        inside `dir`, keyed by file path and modification time, so that
+        subsequent scans of the same directory do not need to open any file.
+        Only files found in `dir` are kept in the cache. If `dir` is not
+        writable, the cache is not saved.
+
         Parameters
         ----------
         dir : path
+        recursive : bool
         """
-        def _process_list(root, mylist):
-            for f in mylist:
-                try:
-                    self.parse_and_append(os.path.join(root, f), flist)
-                    continue
-                except (RuntimeError, ValueError):
-                    pass
-
         if dir is None:
             dir = self.input_path
 
         if dir is None:
             return
 
-        flist = []
+        cache = self._load_metadata_cache(dir)
+        old_cache = dict(cache)
 
         if recursive:
+            groups = []
             for root, dirs, files in os.walk(dir, followlinks=True):
-                if os.path.basename(root):
-                    try:
-                        self.parse_and_append(root, flist)
-                        continue
-                    except (RuntimeError, ValueError):
-                        pass
-
-                _process_list(root, files)
+                groups.append((root, files))
+
+            roots = [root for root, _ in groups if os.path.basename(root)]
+            probed = dict(zip(roots, self._probe_many(roots, dir, cache)))
+
+            flist = []
+            names = []
+            for root, files in groups:
+                fields = probed.get(root)
+                if fields is not None:
+                    flist += fields
+                    continue
+                names += [os.path.join(root, f) for f in files]
+            listed = roots + names
         else:
-            _process_list(dir, os.listdir(dir))
+            flist = []
+            names = [os.path.join(dir, f) for f in os.listdir(dir)]
+            listed = names
+
+        for fields in self._probe_many(names, dir, cache):
+            if fields is not None:
+                flist += fields
+
+        # drop entries of files that have been removed or renamed
+        listed = {os.path.relpath(name, dir) for name in listed}
+        cache = {k: v for k, v in cache.items() if k in listed}
+
+        if cache != old_cache:
+            self._save_metadata_cache(dir, cache)
 
         if not flist:
             raise ValueError('Empty file list')
 
-        data = {'X': flist[0::7], 'Y': flist[1::7], 'Z': flist[2::7],
-                'nfrms': flist[3::7], 'ysize': flist[4::7],
-                'xsize': flist[5::7], 'filename': flist[6::7]}
+        data = {'X': flist[0::9], 'Y': flist[1::9], 'Z': flist[2::9],
+                'nfrms': flist[3::9], 'ysize': flist[4::9],
+                'xsize': flist[5::9], 'dtype': flist[6::9],
+                'nchannels': flist[7::9], 'filename': flist[8::9]}
         df = pd.DataFrame(data)
         df = df.sort_values(['Z', 'Y', 'X'])
 
@@ -145,6 +188,42 @@ class FileMatrix:
         self.data_frame = df.set_index('filename')
         self.process_data_frame()
 
+    def _probe_many(self, names, dir, cache):
+        """Probe `names` concurrently.
+
+        Returns a list with one element per name: either the list of fields
+        produced by :meth:`probe_file` or `None` if the file is not a valid
+        tile.
+        """
+        def probe(name):
+            try:
+                return self.probe_file(name, dir, cache)
+            except (RuntimeError, ValueError):
+                return None
+
+        n_of_threads = max(1, min(self.n_of_threads, len(names)))
+        with ThreadPoolExecutor(max_workers=n_of_threads) as executor:
+            return list(executor.map(probe, names))
+
+    def _load_metadata_cache(self, dir):
+        if not self.use_metadata_cache:
+            return {}
+        try:
+            with open(os.path.join(dir, METADATA_CACHE_FILE_NAME), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_metadata_cache(self, dir, cache):
+        if not self.use_metadata_cache:
+            return
+        fname = os.path.join(dir, METADATA_CACHE_FILE_NAME)
+        try:
+            with open(fname, 'w') as f:
+                json.dump(cache, f)
+        except OSError:
+            logger.warning('cannot write metadata cache {}'.format(fname))
+
     def load_yaml(self, fname):
         logger.info('loading {}'.format(fname))
         with open(fname, 'r') as f:
@@ -180,22 +259,87 @@ class FileMatrix:
         self.compute_end_pos()
         self.name_array = np.array(df.index.values).reshape(self.Ny, self.Nx)
 
-    def parse_and_append(self, name, flist):
-        try:
-            fields = parse_file_name(name)
+    def probe_file(self, name, dir=None, cache=None):
+        """Parse stage coordinates and read stack sizes of tile `name`.
+
+        Parameters
+        ----------
+        name : str
+            path of the tile
+        dir : str
+            root directory, used to compute the key of `name` in `cache`
+        cache : dict
+            metadata cache, updated in place. Entries are keyed by path
+            relative to `dir` and are valid as long as the file modification
+            time is unchanged.
+
+        Returns
+        -------
+        list
+            [`X`, `Y`, `Z`, `nfrms`, `ysize`, `xsize`, `dtype`, `nchannels`,
+            `name`]
+        """
+        fields = parse_file_name(name)
+
+        entry = None
+        if cache is not None:
+            key = os.path.relpath(name, dir)
+            mtime = os.path.getmtime(name)
+            entry = cache.get(key)
+            # entries written by older versions lack dtype and nchannels
+            if entry is not None and (entry['mtime'] != mtime
+                                      or 'dtype' not in entry):
+                entry = None
+
+        if entry is None:
+            with InputFile(name) as infile:
+                entry = {
+                    'nfrms': int(infile.nfrms),
+                    'ysize': int(infile.ysize),
+                    'xsize': int(infile.xsize),
+                    'dtype': np.dtype(infile.dtype).name,
+                    'nchannels': int(infile.nchannels),
+                }
+            if cache is not None:
+                entry['mtime'] = mtime
+                cache[key] = entry
+
+        fields += [entry['nfrms'], entry['ysize'], entry['xsize'],
+                   entry['dtype'], entry['nchannels'], name]
+        return fields
+
+    def tile_metadata(self):
+        """Data type and number of channels of the tiles.
+
+        Both are read from :attr:`data_frame`. If missing there (.yml files
+        saved by older versions), the first tile is probed and the
+        corresponding columns are filled in, so that this happens only once.
+
+        Returns
+        -------
+        tuple
+            (:class:`numpy.dtype`, int)
+        """
+        df = self.data_frame
+        if 'dtype' not in df.columns or 'nchannels' not in df.columns:
+            name = df.iloc[0].name
+            if self.input_path is not None:
+                name = os.path.join(os.path.split(self.input_path)[0], name)
+            logger.info('probing {}'.format(name))
             with InputFile(name) as infile:
-                fields.append(infile.nfrms)
-                fields.append(infile.ysize)
-                fields.append(infile.xsize)
-            flist += fields
-            flist.append(name)
-        except (RuntimeError, ValueError):
-            raise
+                df['dtype'] = np.dtype(infile.dtype).name
+                df['nchannels'] = int(infile.nchannels)
+
+        first = df.iloc[0]
+        return np.dtype(first['dtype']), int(first['nchannels'])
+
+    def parse_and_append(self, name, flist):
+        flist += self.probe_file(name)
 
     def get_json(self):
         keys = ['X', 'Y', 'Z', 'nfrms', 'xsize', 'ysize']
-        abs_keys = ['Xs', 'Ys', 'Zs']
-        for k in abs_keys:
+        optional_keys = ['dtype', 'nchannels', 'Xs', 'Ys', 'Zs']
+        for k in optional_keys:
             if k in self.data_frame.columns:
                 keys.append(k)
         df = self.data_frame[keys].reset_index()
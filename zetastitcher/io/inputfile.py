@@ -7,6 +7,11 @@ try:
 except ImportError:
     pass
 
+try:
+    from .zarrwrapper import ZarrWrapper
+except ImportError:
+    pass
+
 from .ffmpeg_wrapper import FFMPEGWrapper
 from .tiffwrapper import TiffWrapper
 from .zipwrapper import ZipWrapper
@@ -19,10 +24,15 @@ class InputFile(object):
         self.file_name = file_name
         self.wrapper = None
         self._channel = -1
+        self._n_of_threads = 1
         self.nchannels = 1
 
         self.nfrms = None
 
+        self.squeeze_enabled = True
+        """Whether :meth:`__getitem__` squeezes singleton axes (unless
+        indexing is delegated to the underlying wrapper)."""
+
         if file_name is not None:
             self.open()
 
@@ -44,55 +54,51 @@ class InputFile(object):
         item = np.index_exp[item]  # ensure item is a tuple
         myitem = list(item)
 
-        # ensure all items are slice objects
-        # myitem = []
-        if isinstance(item[0], int):
-            start = item[0]
-            stop = item[0] + 1
-            step = 1
-        elif item[0] is Ellipsis:
-            start = 0
-            stop = self.shape[0]
-            step = 1
+        # frames to be read
+        if item[0] is Ellipsis:
+            frames = range(0, self.shape[0])
+        elif isinstance(item[0], (int, np.integer)):
+            i = int(item[0])
+            if i < 0:
+                i += self.shape[0]
+            if not 0 <= i < self.shape[0]:
+                raise IndexError('Index {} out of bounds for axis 0 with size '
+                                 '{}'.format(item[0], self.shape[0]))
+            frames = range(i, i + 1)
+            myitem[0] = slice(None)
         elif isinstance(item[0], slice):
-            start = item[0].start
-            stop = item[0].stop
-            step = item[0].step if item[0].step is not None else 1
-
-            curr_max = self.shape[0]
-            if start is None:
-                start = 0 if step > 0 else curr_max
-            elif start < 0:
-                start += curr_max
-            elif start > curr_max:
-                start = curr_max
-
-            if stop is None:
-                stop = curr_max if step > 0 else 0
-            elif stop < 0:
-                stop += curr_max
-            elif stop > curr_max:
-                stop = curr_max
-
-            if step < 0:
-                temp = start
-                start = stop
-                stop = temp
-                if start > 0:
-                    start += abs(step) - (start - stop) % abs(step)
-                stop += 1
+            frames = range(*item[0].indices(self.shape[0]))
+            myitem[0] = slice(None)
         else:
             raise TypeError("Invalid type: {}".format(type(item[0])))
 
-        a = self.zslice(start, stop)
-        if step < 0:
-            a = a[::-1]
-        a = a[::abs(step)]
-
-        if item[0] is not Ellipsis:
-            myitem[0] = slice(None, None, 1)
-        a = a[myitem]
-
+        if not len(frames):
+            a = self.zslice(0, 1)[tuple(myitem)][:0]
+        elif abs(frames.step) == 1:
+            a = self.zslice(min(frames[0], frames[-1]),
+                            max(frames[0], frames[-1]) + 1)
+            if frames.step < 0:
+                a = a[::-1]
+            a = a[tuple(myitem)]
+        elif not getattr(self.wrapper, 'random_access', True):
+            # sequential readers: decode the covering range of frames once,
+            # since seeking to each frame would decode the file from the
+            # beginning
+            a = self.zslice(min(frames[0], frames[-1]),
+                            max(frames[0], frames[-1]) + 1)
+            a = a[::frames.step][tuple(myitem)]
+        else:
+            # strided: decode only the requested frames, selecting the
+            # requested region right away
+            a = None
+            for k, z in enumerate(frames):
+                f = self.zslice(z, z + 1)[tuple(myitem)]
+                if a is None:
+                    a = np.empty((len(frames),) + f.shape[1:], dtype=f.dtype)
+                a[k] = f[0]
+
+        if not self.squeeze_enabled:
+            return a
         return np.squeeze(a)
 
     @property
@@ -104,6 +110,20 @@ class InputFile(object):
         if not self.nchannels > 1:
             return
         self._channel = value
+        if hasattr(self.wrapper, 'channel'):
+            self.wrapper.channel = value
+
+    @property
+    def n_of_threads(self):
+        """Number of threads used by the underlying wrapper to decode frames
+        concurrently, if supported. Defaults to 1."""
+        return self._n_of_threads
+
+    @n_of_threads.setter
+    def n_of_threads(self, value):
+        self._n_of_threads = value
+        if hasattr(self.wrapper, 'n_of_threads'):
+            self.wrapper.n_of_threads = value
 
     @property
     def file(self):
@@ -146,6 +166,12 @@ class InputFile(object):
         if not os.path.exists(self.file_name):
             raise FileNotFoundError(self.file_name)
 
+        try:
+            self.wrapper = ZarrWrapper(self.file_name)
+            return
+        except (NameError, ValueError):
+            pass
+
         try:
             self.wrapper = TiffWrapper(self.file_name)
             return
@@ -187,6 +213,8 @@ class InputFile(object):
             except AttributeError:
                 pass
 
+        self.n_of_threads = self._n_of_threads
+
     def zslice(self, start_frame, end_frame=None, dtype=None, copy=True):
         """Return a slice, i.e. a substack of frames.
 
@@ -217,6 +245,13 @@ class InputFile(object):
             l = np.zeros(s, dtype=self.dtype)
             for i in range(start_frame, end_frame):
                 l[i - start_frame] = self.wrapper.frame(i)
+
+        if hasattr(self.wrapper, 'channel'):
+            # channel selection and dtype conversion done by the wrapper
+            if self.nchannels > 1 and self.channel == -1:
+                l = np.moveaxis(l, -1, -3)
+            return l
+
         if self.channel == -2:
             l = np.sum(l, axis=-1)
         elif self.channel != -1:
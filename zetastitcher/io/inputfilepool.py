@@ -0,0 +1,72 @@
+import threading
+
+from contextlib import contextmanager
+
+from .inputfile import InputFile
+
+
+class InputFilePool(object):
+    """A bounded pool of open :class:`InputFile` objects, shared by threads.
+
+    Each handle is used by one thread at a time: :meth:`get` returns an idle
+    handle for the requested file, or opens a new one if none is available,
+    so that concurrent reads of the same file never wait for each other.
+    When released, handles are kept open for later reuse; at most
+    :attr:`max_open` idle handles are kept, closing the least recently used
+    ones.
+
+    Example usage:
+
+    >>> pool = InputFilePool()
+    >>> with pool.get('x_000_y_000.tiff') as f:
+    ...     a = f.zslice(0, 10)
+    """
+    def __init__(self, max_open=64):
+        self.max_open = max_open
+
+        self._idle = []  # (file_name, InputFile), least recently used first
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextmanager
+    def get(self, file_name):
+        """Context manager returning an open :class:`InputFile`.
+
+        Parameters
+        ----------
+        file_name : str
+        """
+        f = self._take(file_name)
+        try:
+            yield f
+        finally:
+            self._release(file_name, f)
+
+    def _take(self, file_name):
+        with self._lock:
+            for i in range(len(self._idle) - 1, -1, -1):
+                if self._idle[i][0] == file_name:
+                    return self._idle.pop(i)[1]
+        return InputFile(file_name)
+
+    def _release(self, file_name, f):
+        to_close = []
+        with self._lock:
+            self._idle.append((file_name, f))
+            while len(self._idle) > self.max_open:
+                to_close.append(self._idle.pop(0)[1])
+        for f in to_close:
+            f.close()
+
+    def close(self):
+        """Close all idle handles."""
+        with self._lock:
+            idle = self._idle
+            self._idle = []
+        for _, f in idle:
+            f.close()
@@ -1,9 +1,13 @@
 import glob
 import os.path
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import skimage.external.tifffile as tiff
 
+from .utils import reduce_channels, reduced_dtype, reduced_shape
+
 
 class TiffWrapper(object):
     def __init__(self, file_name=None):
@@ -13,6 +17,17 @@ class TiffWrapper(object):
         self.flist = None
         self.glob_mode = False
 
+        self.channel = -1
+        """Channel selected by :meth:`zslice` (-1: all channels, -2: sum of
+        all channels)."""
+
+        self.n_of_threads = 1
+        """Number of threads used to decode pages concurrently in
+        :meth:`zslice`. Each thread reads through its own file handle."""
+
+        self._fname = None
+        self._handles = []
+
         if file_name is not None:
             self.open()
 
@@ -73,14 +88,66 @@ class TiffWrapper(object):
             self.glob_mode = False
             fname = self.file_name
 
+        self.close()
+        self._fname = fname
         self.tfile = tiff.TiffFile(fname)
-        setattr(self, 'close', getattr(self.tfile, 'close'))
+        self._handles = [self.tfile]
+
+    def close(self):
+        for h in self._handles:
+            h.close()
+        self._handles = []
+
+    def _handle(self, i):
+        while len(self._handles) <= i:
+            self._handles.append(tiff.TiffFile(self._fname))
+        return self._handles[i]
+
+    def _parallel_zslice(self, start_frame, end_frame, dtype=None):
+        """Decode pages [`start_frame`, `end_frame`) using
+        :attr:`n_of_threads` threads, each one reading a contiguous range of
+        pages through a dedicated file handle and writing the final
+        (channel reduced, converted) frames into the output array."""
+        n = end_frame - start_frame
+        n_of_threads = min(self.n_of_threads, n)
+        bounds = np.linspace(start_frame, end_frame,
+                             n_of_threads + 1).astype(int)
+
+        page_shape = tuple(self.tfile.pages[0].shape)
+        frame_shape = page_shape
+        if self.axes == 'SYX':
+            frame_shape = page_shape[1:] + page_shape[:1]
+        out = np.empty(
+            (n,) + reduced_shape(frame_shape, self.channel),
+            dtype=reduced_dtype(self.dtype, self.channel, dtype))
+
+        # open handles beforehand, the list is not thread safe
+        for i in range(n_of_threads):
+            self._handle(i)
+
+        def read(i):
+            lo, hi = bounds[i], bounds[i + 1]
+            a = self._handle(i).asarray(slice(lo, hi))
+            a = a.reshape((hi - lo,) + page_shape)
+            if self.axes == 'SYX':
+                a = np.moveaxis(a, 1, -1)
+            reduce_channels(a, self.channel, dtype,
+                            out=out[lo - start_frame:hi - start_frame])
+
+        with ThreadPoolExecutor(max_workers=n_of_threads) as executor:
+            # consume results so that exceptions are propagated
+            list(executor.map(read, range(n_of_threads)))
+
+        return out
 
     def zslice(self, start_frame, end_frame=None, dtype=None, copy=True):
         if end_frame is None:
             end_frame = start_frame + 1
 
         if not self.glob_mode:
+            if (self.n_of_threads > 1 and end_frame - start_frame > 1
+                    and not self.axes.startswith('IYX')):
+                return self._parallel_zslice(start_frame, end_frame, dtype)
             a = self.tfile.asarray(slice(start_frame, end_frame))
         else:
             frames_per_file = self.nfrms // len(self.flist)
@@ -94,6 +161,4 @@ class TiffWrapper(object):
         if self.axes == 'SYX':
             a = np.moveaxis(a, 1, -1)
 
-        if dtype is None:
-            return a
-        return a.astype(dtype)
+        return reduce_channels(a, self.channel, dtype)
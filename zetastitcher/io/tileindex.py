@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class TileIndex(object):
+    """Spatial index of tile bounding boxes, for fast intersection queries.
+
+    Tiles are binned on a uniform grid in the (Y, X) plane, with cells as
+    large as the largest tile, so that each tile falls in at most 4 cells.
+    A query only checks the tiles binned in the cells it spans, instead of
+    the whole mosaic.
+
+    Example usage:
+
+    >>> index = TileIndex(fm.data_frame)
+    >>> index.query(0, 10, 1000, 1500, 2000, 2400)
+    array([3, 4])
+    """
+    def __init__(self, data_frame):
+        """
+        Parameters
+        ----------
+        data_frame : :class:`pandas.DataFrame`
+            Tiles with absolute positions, as in
+            :attr:`FileMatrix.data_frame`.
+        """
+        cols = ['Zs', 'Zs_end', 'Ys', 'Ys_end', 'Xs', 'Xs_end']
+        self.bbox = data_frame[cols].values.astype(int)
+        """Bounding boxes of the tiles (in the same order as in the data
+        frame), in the form ``[Zs, Zs_end, Ys, Ys_end, Xs, Xs_end]``."""
+
+        yx = self.bbox[:, 2:]
+        self.origin = (yx[:, 0].min(initial=0), yx[:, 2].min(initial=0))
+        self.end = (yx[:, 1].max(initial=0), yx[:, 3].max(initial=0))
+        self.cell_shape = ((yx[:, 1] - yx[:, 0]).max(initial=1),
+                           (yx[:, 3] - yx[:, 2]).max(initial=1))
+
+        cells = {}
+        for i, (y_from, y_to, x_from, x_to) in enumerate(yx):
+            for cell in self._cells(y_from, y_to, x_from, x_to):
+                cells.setdefault(cell, []).append(i)
+        self._cells_to_tiles = {k: np.array(v) for k, v in cells.items()}
+
+    def _cells(self, y_from, y_to, x_from, x_to):
+        """Grid cells spanned by the region [`y_from`, `y_to`) x [`x_from`,
+        `x_to`)."""
+        (oy, ox), (cy, cx) = self.origin, self.cell_shape
+        for j in range((y_from - oy) // cy, (y_to - 1 - oy) // cy + 1):
+            for i in range((x_from - ox) // cx, (x_to - 1 - ox) // cx + 1):
+                yield j, i
+
+    def query(self, z_from, z_to, y_from, y_to, x_from, x_to):
+        """Tiles intersecting the given region (absolute coordinates, stop
+        excluded).
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            Sorted positions of the intersecting tiles in the data frame.
+        """
+        # clip to the extent of the mosaic
+        y_from = max(y_from, self.origin[0])
+        y_to = min(y_to, self.end[0])
+        x_from = max(x_from, self.origin[1])
+        x_to = min(x_to, self.end[1])
+        if z_from >= z_to or y_from >= y_to or x_from >= x_to:
+            return np.array([], dtype=int)
+
+        candidates = [self._cells_to_tiles[c] for c in self._cells(
+            y_from, y_to, x_from, x_to) if c in self._cells_to_tiles]
+        if not candidates:
+            return np.array([], dtype=int)
+        candidates = np.unique(np.concatenate(candidates))
+
+        bbox = self.bbox[candidates]
+        mask = ((bbox[:, 1] > z_from) & (bbox[:, 0] < z_to)
+                & (bbox[:, 3] > y_from) & (bbox[:, 2] < y_to)
+                & (bbox[:, 5] > x_from) & (bbox[:, 4] < x_to))
+        return candidates[mask]
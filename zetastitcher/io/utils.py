@@ -0,0 +1,59 @@
+import numpy as np
+
+
+def reduced_shape(shape, channel):
+    """Shape of an array of frames after :func:`reduce_channels`.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the input array, with channels along the last axis.
+    channel : int
+        See :func:`reduce_channels`.
+    """
+    if channel == -1:
+        return tuple(shape)
+    return tuple(shape[:-1])
+
+
+def reduced_dtype(in_dtype, channel, dtype=None):
+    """Dtype of an array of frames after :func:`reduce_channels`."""
+    if dtype is not None:
+        return np.dtype(dtype)
+    if channel == -2:
+        return np.sum(np.zeros(1, dtype=in_dtype)).dtype
+    return np.dtype(in_dtype)
+
+
+def reduce_channels(a, channel=-1, dtype=None, out=None):
+    """Select or sum color channels and convert to `dtype` in a single pass.
+
+    Parameters
+    ----------
+    a : :class:`numpy.ndarray`
+        Input frames, with channels along the last axis.
+    channel : int
+        Channel to select. Use -2 to sum all channels, -1 to keep all of them.
+    dtype
+        Output dtype. If None, keep the original dtype (when summing,
+        follow numpy promotion rules as in :func:`numpy.sum`).
+    out : :class:`numpy.ndarray`
+        If specified, write the result into `out`, which must have shape
+        :func:`reduced_shape`.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+    """
+    if channel == -2:
+        return np.sum(a, axis=-1, dtype=dtype, out=out)
+
+    if channel != -1:
+        a = a[..., channel]
+
+    if out is not None:
+        out[...] = a
+        return out
+    if dtype is None:
+        return a
+    return a.astype(dtype)
@@ -1,23 +1,75 @@
 """API to query an arbitrary region in the stitched volume."""
 
+import json
+import math
+import uuid
+import hashlib
 import os.path
+import asyncio
 import logging
+import itertools
 import threading
 
-from queue import Queue
-from functools import lru_cache
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError
 
 import numpy as np
 
+try:
+    import dask.array as da
+except ImportError:
+    pass
+
+try:
+    import zarr
+except ImportError:
+    pass
+
 from .filematrix import FileMatrix
 from .inputfile import InputFile
-from ..fuser.overlaps import Overlaps
-from ..fuser.fuse import fuse_queue, to_dtype
+from .inputfilepool import InputFilePool
+from .tileindex import TileIndex
+from ..fuser.overlaps import Overlaps, in_z_range
+from ..fuser.fuse import fuse_tile, to_dtype
 
 logger = logging.getLogger(__name__)
 logger.addHandler(logging.NullHandler())
 
 
+OVERVIEW_SUFFIX = '.overview.zarr'
+
+PROJECTIONS = ['max', 'mean']
+"""Projection modes accepted by :meth:`VirtualFusedVolume.projection`."""
+
+
+def overview_path(yml_file):
+    """Path of the multiscale overview of the volume described by
+    `yml_file`, as built by ``stitch-overview``."""
+    return os.path.splitext(yml_file)[0] + OVERVIEW_SUFFIX
+
+
+def positions_hash(fm):
+    """Hash of the names, positions and sizes of the tiles in `fm`.
+
+    It is stored in the overview when it is built, so that overviews of
+    outdated positions are detected.
+
+    Parameters
+    ----------
+    fm : :class:`FileMatrix`
+        File matrix with absolute positions.
+
+    Returns
+    -------
+    str
+    """
+    df = fm.data_frame.sort_index()
+    keys = ['Xs', 'Ys', 'Zs', 'nfrms', 'ysize', 'xsize']
+    tiles = [[name] + [int(x) for x in row]
+             for name, row in zip(df.index, df[keys].values)]
+    return hashlib.sha1(json.dumps(tiles).encode()).hexdigest()
+
+
 class VirtualFusedVolume:
     """An API to query arbitrary regions in the stitched volume.
 
@@ -31,6 +83,33 @@ class VirtualFusedVolume:
 
     >>> subvolume = vfv[40, ..., 1000:1500, 2000:2400]
 
+    Tiles are kept open between queries. Call :meth:`close` to release open
+    files and cached chunks.
+
+    Optionally, fused regions can be cached: set :attr:`cache_size` to
+    compute regions in chunks on a fixed grid (see :attr:`chunk_shape`) and
+    keep the most recently used chunks in memory, so that repeated or
+    adjacent queries do not need to read the tiles again. The cache trades
+    latency for throughput: a query fuses all the chunks it touches, e.g.
+    with the default chunk shape a single plane ``vfv[40]`` fuses 32 planes.
+    This pays off when browsing neighbouring regions, but not for isolated
+    queries.
+
+    >>> vfv.cache_size = 2 * 1024 ** 3
+
+    From a coroutine, use :meth:`get_region` to query regions without
+    blocking the event loop:
+
+    >>> subvolume = await vfv.get_region(np.index_exp[40, ..., 1000:1500])
+
+    For computations over the whole volume, :meth:`to_dask` returns a lazy
+    chunked view whose blocks are fused on demand. Projections along Z are
+    computed by :meth:`projection` without fusing the volume.
+
+    If a multiscale overview has been built next to the .yml file (see
+    ``stitch-overview``), strided queries are served from the closest
+    downsampled level (whose voxels are averages of 2x2x2 blocks) instead of
+    being fused from the tiles.
     """
     def __init__(self, file_or_matrix):
         if isinstance(file_or_matrix, str):
@@ -53,16 +132,115 @@ class VirtualFusedVolume:
             self.fm.compute_nominal_positions(1, 1)
             self.ov = None
 
+        self._tiles = list(self.fm.data_frame.itertuples())
+        self._tile_index = TileIndex(self.fm.data_frame)
+
         self._debug = False
 
-        infile = os.path.join(self.path, self.fm.data_frame.iloc[0].name)
-        with InputFile(infile) as f:
-            self.temp_shape = list(f.shape)
-            self.dtype = f.dtype
-            self.nchannels = f.nchannels
+        # volume metadata, without opening any file
+        self.dtype, self.nchannels = self.fm.tile_metadata()
+
+        first = self.fm.data_frame.iloc[0]
+        channels = [self.nchannels] if self.nchannels > 1 else []
+        self.temp_shape = [int(first[k]) for k in ['nfrms', 'ysize',
+                                                   'xsize']]
+        self.temp_shape[1:1] = channels
+
+        self._shape = tuple(int(x) for x in [self.fm.full_thickness]
+                            + channels + [self.fm.full_height,
+                                          self.fm.full_width])
 
         self.squeeze_enabled = True
 
+        self.chunk_shape = (32, 256, 256)
+        """Shape (Z, Y, X) of the grid of fused chunks kept in cache."""
+
+        self.cache_size = 0
+        """Maximum size in bytes of the cache of fused chunks. Defaults to
+        0 (no caching), so that each query fuses only the requested region.
+        Only queries with unit steps are served from the cache."""
+
+        self.n_of_threads = 8
+        """Number of threads used to read tiles concurrently."""
+
+        self.use_overview = True
+        """Whether to serve strided queries from the multiscale overview, if
+        available."""
+
+        self._pool = InputFilePool()
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._cache_lock = threading.Lock()
+        self._pending = {}  # in-flight queries of get_region()
+
+        self._overview = self._open_overview()
+
+    def _open_overview(self):
+        """Open the downsampled levels of the overview, if available.
+
+        Returns
+        -------
+        dict
+            Level `i` (downsampled by ``2 ** i``) -> :class:`InputFile`.
+        """
+        levels = {}
+        if self.ov is None or self.fm.input_path is None or not \
+                os.path.isfile(self.fm.input_path):
+            return levels
+
+        path = overview_path(self.fm.input_path)
+        if not os.path.isdir(path):
+            return levels
+
+        try:
+            h = zarr.open_group(path, mode='r').attrs.get('positions_hash')
+        except (NameError, ValueError, OSError):
+            logger.warning('cannot read overview {}'.format(path))
+            return levels
+
+        if h != positions_hash(self.fm):
+            # positions have changed, or the overview is incomplete
+            logger.warning('ignoring outdated overview {}'.format(path))
+            return levels
+
+        level = 1
+        while os.path.isdir(os.path.join(path, str(level))):
+            try:
+                f = InputFile(os.path.join(path, str(level)))
+            except (ValueError, OSError):
+                logger.warning('cannot read overview {}'.format(path))
+                break
+
+            expected = [-(-self.shape[i] // 2 ** level) for i in [0, -2, -1]]
+            if [f.shape[i] for i in [0, -2, -1]] != expected:
+                logger.warning('ignoring outdated overview {}'.format(path))
+                f.close()
+                break
+
+            levels[level] = f
+            level += 1
+
+        if levels:
+            logger.info('using overview {} ({} levels)'.format(
+                path, len(levels)))
+        return levels
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close open tiles and clear the cache of fused chunks."""
+        self._pool.close()
+        for f in self._overview.values():
+            f.close()
+        self._overview = {}
+        with self._cache_lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
     @property
     def overlay_debug_enabled(self):
         """Whether to overlay debug information (tile edges and numbers).
@@ -75,178 +253,616 @@ class VirtualFusedVolume:
         self._debug = value
 
     @property
-    @lru_cache()
     def shape(self):
         """Shape of the whole stitched volume.
 
         Axis order is ZCYX.
         """
-        thickness = self.fm.full_thickness
-
-        infile = os.path.join(self.path, self.fm.data_frame.iloc[0].name)
-        with InputFile(infile) as f:
-            output_shape = list(f.shape)
-
-        output_shape[0] = thickness
-        output_shape[-2] = self.fm.full_height
-        output_shape[-1] = self.fm.full_width
-
-        return tuple(output_shape)
+        return self._shape
 
     def __getitem__(self, item):
+        myitem, flip_axis = self._normalize_item(item)
+        return self._get(myitem, flip_axis)
+
+    async def get_region(self, item, executor=None):
+        """Query a region without blocking the event loop.
+
+        Tiles are read and fused on `executor`, in the same way as
+        :meth:`__getitem__`. Concurrent queries of the same region share a
+        single computation, which is cancelled when all of them have been
+        cancelled.
+
+        Parameters
+        ----------
+        item
+            Index expression, as accepted by :meth:`__getitem__` (e.g.
+            ``np.index_exp[40, ..., 1000:1500]``).
+        executor : :class:`concurrent.futures.Executor`
+            If `None`, use the default executor of the event loop.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The fused region. Since it can be shared by concurrent queries,
+            it is read-only.
+        """
+        myitem, flip_axis = self._normalize_item(item)
+        loop = asyncio.get_running_loop()
+        key = (loop, tuple((it.start, it.stop, it.step) for it in myitem),
+               tuple(flip_axis), self._debug, self.squeeze_enabled)
+
+        pending = self._pending.get(key)
+        if pending is None:
+            cancel = threading.Event()
+            pending = _PendingQuery(loop.run_in_executor(
+                executor, self._get_shared, myitem, flip_axis, cancel),
+                cancel)
+            self._pending[key] = pending
+            pending.future.add_done_callback(
+                lambda _: self._forget(key, pending))
+        else:
+            logger.info('joining pending query {}'.format(myitem))
+
+        pending.waiters += 1
+        try:
+            return await asyncio.shield(pending.future)
+        finally:
+            pending.waiters -= 1
+            if pending.waiters == 0 and not pending.future.done():
+                logger.info('cancelling query {}'.format(myitem))
+                pending.cancel()
+                self._forget(key, pending)
+
+    def to_dask(self, chunks=None):
+        """Lazy view of the whole stitched volume as a dask array.
+
+        Each block is fused from the tiles only when computed, so that
+        block-parallel computations (e.g. ``.max(axis=0)``) run over the
+        full volume without materializing it. Requires the ``dask``
+        package.
+
+        Parameters
+        ----------
+        chunks
+            Block shape, in any form accepted by :func:`dask.array.ones`.
+            If `None`, use :attr:`chunk_shape` along Z, Y and X and a single
+            block along C.
+
+        Returns
+        -------
+        :class:`dask.array.Array`
+            Array with the same shape (ZCYX) and dtype as the volume.
+        """
+        if chunks is None:
+            chunks = list(self.shape)
+            for a, c in zip([0, -2, -1], self.chunk_shape):
+                chunks[a] = c
+            chunks = tuple(chunks)
+
+        try:
+            chunks = da.core.normalize_chunks(chunks, self.shape,
+                                              dtype=self.dtype)
+        except NameError:
+            raise ValueError('to_dask requires the dask package')
+
+        def fuse_block(block_info=None):
+            location = block_info[None]['array-location']
+            return self._fuse([slice(a, b, 1) for a, b in location])
+
+        return da.map_blocks(
+            fuse_block, chunks=chunks, dtype=self.dtype,
+            meta=np.empty((0,) * len(self.shape), dtype=self.dtype),
+            name='virtual-fused-volume-{}'.format(uuid.uuid4().hex))
+
+    def projection(self, mode='max', z_from=0, z_to=None, channel=-1):
+        """Projection of the stitched volume along Z.
+
+        Each tile is projected on its own, reading ``chunk_shape[0]`` frames
+        at a time, and tile projections are then blended in 2D with the same
+        weights used for fusion. Within overlaps the result is therefore an
+        approximation of the projection of the fused volume, which is never
+        computed.
+
+        Parameters
+        ----------
+        mode : str
+            One of :data:`PROJECTIONS`.
+        z_from : int
+            First frame of the projected range.
+        z_to : int
+            Last frame (noninclusive) of the projected range. If `None`,
+            project up to the last frame.
+        channel : int
+            Channel to project in multichannel volumes. Use -2 to project
+            the sum of all channels, -1 (default) to project all of them.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            Array of shape (Y, X), or (C, Y, X) for multichannel volumes
+            when `channel` is -1.
+        """
+        if mode not in PROJECTIONS:
+            raise ValueError('invalid projection mode: {}'.format(mode))
+        if z_to is None or z_to > self.shape[0]:
+            z_to = self.shape[0]
+        if self.nchannels == 1:
+            channel = -1
+
+        tiles = [self._tiles[i] for i in self._tile_index.query(
+            z_from, z_to, 0, self.shape[-2], 0, self.shape[-1])]
+
+        # projections are blended as a single frame
+        frame_shape = self.shape[1:] if channel == -1 else self.shape[-2:]
+        fused = np.zeros((1,) + frame_shape, dtype=np.float32)
+
+        def project(row):
+            index = row.Index
+            zfrom = max(z_from - row.Zs, 0)
+            zto = min(z_to - row.Zs, row.nfrms)
+
+            logger.info('projecting {}\t{}:{}'.format(index, zfrom, zto))
+            p = None
+            with self._pool.get(os.path.join(self.path, index)) as f:
+                f.channel = channel
+                try:
+                    for z in range(zfrom, zto, self.chunk_shape[0]):
+                        a = f.zslice(z, min(z + self.chunk_shape[0], zto))
+                        if mode == 'max':
+                            a = a.max(axis=0)
+                            p = a if p is None else np.maximum(p, a)
+                        else:
+                            a = a.sum(axis=0, dtype=np.float64)
+                            p = a if p is None else p + a
+                finally:
+                    f.channel = -1
+            if mode == 'mean':
+                # frames of the range not covered by the tile count as zeros,
+                # as in the fused volume
+                p /= z_to - z_from
+            p = p[np.newaxis].astype(np.float32)
+
+            if self.ov is None or len(tiles) == 1:
+                overlaps = None
+            else:
+                # overlaps within the projected frames, on the single frame
+                overlaps = in_z_range(self.ov[index], zfrom, zto - 1)
+                overlaps['Z_from'] = 0
+                overlaps['Z_to'] = 1
+
+            return [p, index, zfrom, None, [0, row.Ys, row.Xs], overlaps]
+
+        n_of_workers = max(1, min(self.n_of_threads, len(tiles)))
+        with ThreadPoolExecutor(max_workers=n_of_workers) as executor:
+            for got in executor.map(project, tiles):
+                fuse_tile(fused, *got, frame_shape=self.temp_shape[-2::],
+                          debug=self._debug)
+
+        return to_dtype(fused[0], self.dtype)
+
+    def _forget(self, key, pending):
+        if self._pending.get(key) is pending:
+            del self._pending[key]
+
+    def _get_shared(self, myitem, flip_axis, cancel):
+        a = self._get(myitem, flip_axis, cancel)
+        a.setflags(write=False)
+        return a
+
+    def _normalize_item(self, item):
+        """Normalize an index expression.
+
+        Returns
+        -------
+        tuple
+            A list of slices with positive steps, one for each axis, and the
+            list of steps (1 or -1) along which the result must be flipped.
+        """
         # ensure item is a tuple
         if isinstance(item, list):
             item = tuple(item)
         else:
             item = np.index_exp[item]
 
-        # ensure all items are slice objects
+        # ensure all items are slice objects with positive steps, flipping
+        # the result afterwards where steps are negative
         myitem = []
         flip_axis = []
         for i in item:
-            if isinstance(i, int):
-                start = i
-                stop = i + 1
-                step = 1
-            elif i is Ellipsis:
+            if i is Ellipsis:
                 for _ in range(0, len(self.shape) - len(item) + 1):
                     myitem.append(slice(0, self.shape[len(myitem)], 1))
                     flip_axis.append(1)
                 continue
+
+            if len(myitem) >= len(self.shape):
+                raise IndexError('Too many indices for array')
+            curr_max = self.shape[len(myitem)]
+
+            if isinstance(i, (int, np.integer)):
+                start = int(i) + curr_max if i < 0 else int(i)
+                if not 0 <= start < curr_max:
+                    raise IndexError(
+                        'Index {} out of bounds for axis {} with size '
+                        '{}'.format(i, len(myitem), curr_max))
+                r = range(start, start + 1)
             elif isinstance(i, slice):
-                start = i.start
-                stop = i.stop
-                step = i.step if i.step is not None else 1
+                r = range(*i.indices(curr_max))
             else:
                 raise TypeError("Invalid type: {}".format(type(i)))
 
-            curr_max = self.shape[len(myitem)]
-            if start is None:
-                start = 0 if step > 0 else curr_max
-            elif start < 0:
-                start += curr_max
-            elif start > curr_max:
-                start = curr_max
-
-            if stop is None:
-                stop = curr_max if step > 0 else 0
-            elif stop < 0:
-                stop += curr_max
-            elif stop > curr_max:
-                stop = curr_max
-
-            if step < 0:
-                start += abs(step)
-                stop += abs(step)
-
-            flip_axis.append(1 if step > 0 else -1)
-
-            if start < stop:
-                myitem.append(slice(start, stop, abs(step)))
+            flip_axis.append(1 if r.step > 0 else -1)
+            if r.step < 0:
+                r = r[::-1]
+
+            if len(r):
+                myitem.append(slice(r.start, r[-1] + 1, r.step))
             else:
-                myitem.append(slice(stop, start, abs(step)))
+                myitem.append(slice(r.start, r.start, r.step))
 
         for _ in range(0, len(self.shape) - len(myitem)):
             myitem.append(slice(0, self.shape[len(myitem)], 1))
+            flip_axis.append(1)
 
         if len(myitem) != len(self.shape):
             raise IndexError('Too many indices for array')
 
-        zmin = myitem[0].start
-        zmax = myitem[0].stop
-
-        ymin = myitem[-2].start
-        ymax = myitem[-2].stop
+        return myitem, flip_axis
 
-        xmin = myitem[-1].start
-        xmax = myitem[-1].stop
+    def _get(self, myitem, flip_axis, cancel=None):
+        """Compute the region `myitem`, flipping it along `flip_axis` (as
+        returned by :meth:`_normalize_item`).
 
-        output_shape = [
-            (it.stop - it.start) // it.step for it in myitem
-        ]
+        If the event `cancel` is set, the computation is abandoned raising
+        :class:`concurrent.futures.CancelledError`.
+        """
+        output_shape = [len(range(it.start, it.stop, it.step))
+                        for it in myitem]
         if 0 in output_shape:
             return np.array([], dtype=self.dtype)
 
-        X_min = np.array([myitem[i].start for i in [0, -2, -1]])
-        X_stop = np.array([myitem[i].stop for i in [0, -2, -1]])
-        steps = np.array([myitem[i].step for i in [0, -2, -1]])
+        level = self._overview_level(myitem)
+        use_cache = (self.cache_size > 0 and not self._debug
+                     and all(myitem[i].step == 1 for i in [0, -2, -1]))
+        if level is not None:
+            fused = self._from_overview(myitem, level)
+        elif use_cache:
+            fused = self._get_cached(myitem, cancel)
+        else:
+            fused = self._fuse(myitem, cancel)
 
-        df = self.fm.data_frame
-        df = df[
-            (df['Zs_end'] > zmin) & (df['Zs'] < zmax)
-            & (df['Ys_end'] > ymin) & (df['Ys'] < ymax)
-            & (df['Xs_end'] > xmin) & (df['Xs'] < xmax)
-        ]
+        return self._flip_and_squeeze(fused, flip_axis)
 
-        if self.ov is None or df.shape[0] == 1:
-            dtype = self.dtype
-        else:
-            dtype = np.float32
+    def _flip_and_squeeze(self, fused, flip_axis):
+        ie = [slice(None, None, flip) for flip in flip_axis]
+        fused = fused[tuple(ie)]
 
-        fused = np.zeros(output_shape, dtype=dtype)
+        if self.squeeze_enabled:
+            return np.squeeze(fused)
+        return fused
 
-        q = Queue(maxsize=20)
+    def get_regions(self, items):
+        """Query many regions at once.
+
+        Regions are planned together: the frames of each tile are read only
+        once, and all the regions they contribute to are fused from the same
+        buffer. Regions whose frames overlap or are adjacent are read
+        together, whereas sparse regions of the same tile (e.g. far apart
+        along Z) are read separately. This is much faster than separate
+        queries when regions share tiles (e.g. patches sampled from the same
+        area). Strided regions are served from the overview, when available,
+        as in :meth:`__getitem__`; the cache of fused chunks is not used.
+
+        Parameters
+        ----------
+        items : list
+            Index expressions, as accepted by :meth:`__getitem__` (e.g.
+            ``[np.index_exp[40, 1000:1500], np.index_exp[41, 1000:1500]]``).
+
+        Returns
+        -------
+        list
+            One :class:`numpy.ndarray` for each region, in the same order as
+            `items`.
+        """
+        queries = [self._normalize_item(item) for item in items]
+
+        regions = []
+        to_fuse = []
+        for myitem, _ in queries:
+            output_shape = [len(range(it.start, it.stop, it.step))
+                            for it in myitem]
+            level = self._overview_level(myitem)
+            if 0 in output_shape:
+                regions.append(np.array([], dtype=self.dtype))
+            elif level is not None:
+                regions.append(self._from_overview(myitem, level))
+            else:
+                regions.append(None)
+                to_fuse.append(myitem)
+
+        fused = iter(self._fuse_many(to_fuse))
+        ret = []
+        for a, (_, flip_axis) in zip(regions, queries):
+            if a is None:
+                a = next(fused)
+            elif not a.size:
+                ret.append(a)
+                continue
+            ret.append(self._flip_and_squeeze(a, flip_axis))
+        return ret
+
+    def _overview_level(self, myitem):
+        """Coarsest overview level whose resolution is not lower than that
+        of the query along Z, Y and X, or `None`."""
+        if not self.use_overview or self._debug or not self._overview:
+            return None
+        step = min(myitem[i].step for i in [0, -2, -1])
+        level = min(step.bit_length() - 1, max(self._overview))
+        return level if level > 0 else None
+
+    def _from_overview(self, myitem, level):
+        """Read the region `myitem` from overview `level`, taking the voxel
+        containing each of the requested ones."""
+        indices = [np.arange(myitem[i].start, myitem[i].stop, myitem[i].step)
+                   // 2 ** level for i in [0, -2, -1]]
+
+        region = [slice(i[0], i[-1] + 1) for i in indices]
+        if len(myitem) > 3:
+            region.insert(1, myitem[1])
+
+        a = self._overview[level][tuple(region)]
+        for axis, i in zip([0, -2, -1], indices):
+            a = np.take(a, i - i[0], axis=axis)
+        return a
+
+    def _get_cached(self, myitem, cancel=None):
+        """Assemble the region `myitem` (slices with unit step along Z, Y
+        and X) from cached chunks, fusing the missing ones."""
+        output_shape = [len(range(it.start, it.stop, it.step))
+                        for it in myitem]
+        fused = np.empty(output_shape, dtype=self.dtype)
+
+        axes = [0, -2, -1]
+        spans = [range(myitem[a].start // c, (myitem[a].stop - 1) // c + 1)
+                 for a, c in zip(axes, self.chunk_shape)]
+
+        for key in itertools.product(*spans):
+            _check_cancelled(cancel)
+            chunk = self._chunk(key, cancel)
+
+            src = list(myitem)
+            dst = [slice(None)] * len(myitem)
+            for a, c, k in zip(axes, self.chunk_shape, key):
+                it = myitem[a]
+                lo = max(it.start, k * c)
+                hi = min(it.stop, (k + 1) * c)
+                src[a] = slice(lo - k * c, hi - k * c)
+                dst[a] = slice(lo - it.start, hi - it.start)
+
+            fused[tuple(dst)] = chunk[tuple(src)]
 
-        t = threading.Thread(
-            target=fuse_queue,
-            args=(q, fused, self.temp_shape[-2::], self._debug))
-        t.start()
+        return fused
 
-        sl = myitem[:]
+    def _chunk(self, key, cancel=None):
+        """Fused chunk of index `key` = (z, y, x) on the grid defined by
+        :attr:`chunk_shape`, from cache if available."""
+        cache_key = (tuple(self.chunk_shape), key)
+        with self._cache_lock:
+            chunk = self._cache.get(cache_key)
+            if chunk is not None:
+                self._cache.move_to_end(cache_key)
+                return chunk
+
+        item = [slice(0, n, 1) for n in self.shape]
+        for a, c, k in zip([0, -2, -1], self.chunk_shape, key):
+            item[a] = slice(k * c, min((k + 1) * c, self.shape[a]), 1)
+
+        logger.info('fusing chunk {}'.format(key))
+        chunk = self._fuse(item, cancel)
+        chunk.setflags(write=False)
+
+        with self._cache_lock:
+            if cache_key not in self._cache:
+                self._cache[cache_key] = chunk
+                self._cache_bytes += chunk.nbytes
+            while self._cache_bytes > self.cache_size:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted.nbytes
+
+        return chunk
+
+    def _query_tiles(self, myitem):
+        """Tiles intersecting the region `myitem`."""
+        bounds = [(myitem[i].start, myitem[i].stop) for i in [0, -2, -1]]
+        return self._tile_index.query(*itertools.chain(*bounds))
+
+    def _fused_dtype(self, n_of_tiles):
+        """Dtype used to fuse a region made of `n_of_tiles` tiles."""
+        if self.ov is None or n_of_tiles == 1:
+            return self.dtype
+        return np.float32
+
+    @staticmethod
+    def _tile_region(row, myitem):
+        """Slices of tile `row` (in tile coordinates) contributing to the
+        region `myitem`, and position in the region of their first pixel
+        along Z, Y and X."""
+        X_min = np.array([myitem[i].start for i in [0, -2, -1]])
+        X_stop = np.array([myitem[i].stop for i in [0, -2, -1]])
+        steps = np.array([myitem[i].step for i in [0, -2, -1]])
 
-        for index, row in df.iterrows():
-            Xs = np.array([row.Zs, row.Ys, row.Xs])
-            xsize = np.array([row.nfrms, row.ysize, row.xsize])
+        Xs = np.array([row.Zs, row.Ys, row.Xs])
+        xsize = np.array([row.nfrms, row.ysize, row.xsize])
 
-            xto = X_stop - Xs
-            xto[xto > xsize] = xsize[xto > xsize]
-            xfrom = X_min - Xs
-            xfrom[xfrom < 0] = 0
-            xfrom = xfrom + (Xs + xfrom - X_min) % steps
+        xto = X_stop - Xs
+        xto[xto > xsize] = xsize[xto > xsize]
+        xfrom = X_min - Xs
+        xfrom[xfrom < 0] = 0
+        # first pixel of the tile on the output grid
+        xfrom = xfrom + (X_min - Xs - xfrom) % steps
 
-            for i in [0, -2, -1]:
-                sl[i] = slice(xfrom[i], xto[i], steps[i])
+        sl = myitem[:]
+        for i, a in enumerate([0, -2, -1]):
+            sl[a] = slice(xfrom[i], xto[i], steps[i])
 
-            z_from = sl[0].start
-            z_to = sl[0].stop
+        top_left = (Xs + xfrom - X_min) // steps
+        return sl, top_left
 
-            x_from = np.array([sl[i].start for i in [0, -2, -1]])
+    def _tile_overlaps(self, index, sl):
+        """Overlaps of tile `index` within the frames selected by `sl[0]`,
+        along Z of the strided slice."""
+        overlaps = in_z_range(self.ov[index], sl[0].start, sl[0].stop)
+        for c in ['Z_from', 'Z_to']:
+            overlaps[c] = -(-overlaps[c] // sl[0].step)
+        return overlaps
 
-            logger.info('loading {}\t{}'.format(index, sl))
-            with InputFile(os.path.join(self.path, index)) as f:
-                sl_a = np.copy(f[tuple(sl)]).astype(dtype)
-            sl_a.shape = ([1 for _ in range(0, len(sl) - len(sl_a.shape))]
-                          + list(sl_a.shape))
+    def _fuse(self, myitem, cancel=None):
+        """Fuse the region `myitem` (a list of slices with positive steps,
+        one for each axis)."""
+        output_shape = [len(range(it.start, it.stop, it.step))
+                        for it in myitem]
 
-            Top_left = Xs + x_from
-            top_left = (Top_left - X_min) // steps
+        tiles = [self._tiles[i] for i in self._query_tiles(myitem)]
 
-            if self.ov is None or df.shape[0] == 1:
-                overlaps = None
-            else:
-                overlaps = self.ov[index]
-                overlaps = overlaps.loc[
-                    (overlaps['Z_from'] <= z_to) & (overlaps['Z_to'] >= z_from)
-                    ].copy()
+        dtype = self._fused_dtype(len(tiles))
+        fused = np.zeros(output_shape, dtype=dtype)
 
-                overlaps['Z_from'] -= z_from
-                overlaps['Z_to'] -= z_from
-                overlaps['Z_to'] /= abs(sl[0].step)
-                overlaps['Z_to'] = overlaps['Z_to'].apply(np.round).astype(int)
+        def load(row):
+            _check_cancelled(cancel)
+            index = row.Index
+            sl, top_left = self._tile_region(row, myitem)
 
-                overlaps.loc[overlaps['Z_from'] < 0, 'Z_from'] = 0
+            logger.info('loading {}\t{}'.format(index, sl))
+            # only the requested frames (and pixels, where supported by the
+            # reader) are decoded
+            with self._pool.get(os.path.join(self.path, index)) as f:
+                f.squeeze_enabled = False
+                sl_a = np.asarray(f[tuple(sl)]).astype(dtype, copy=False)
 
-            q.put([sl_a, index, z_from, tuple(sl), top_left, overlaps])
+            if self.ov is None or len(tiles) == 1:
+                overlaps = None
+            else:
+                overlaps = self._tile_overlaps(index, sl)
+
+            return [sl_a, index, sl[0].start, tuple(sl), top_left, overlaps]
+
+        # tiles are read concurrently and fused as soon as they are loaded,
+        # in a fixed order
+        n_of_workers = max(1, min(self.n_of_threads, len(tiles)))
+        with ThreadPoolExecutor(max_workers=n_of_workers) as executor:
+            for got in executor.map(load, tiles):
+                _check_cancelled(cancel)
+                fuse_tile(fused, *got, frame_shape=self.temp_shape[-2::],
+                          debug=self._debug)
+
+        return to_dtype(fused, self.dtype)
+
+    def _fuse_many(self, items):
+        """Fuse the regions `items` (as in :meth:`_fuse`), reading each tile
+        once."""
+        fused = []
+        plans = {}  # tile position -> [(region, slices, top left, single)]
+        for r, myitem in enumerate(items):
+            output_shape = [len(range(it.start, it.stop, it.step))
+                            for it in myitem]
+            positions = self._query_tiles(myitem)
+            fused.append(np.zeros(output_shape,
+                                  dtype=self._fused_dtype(len(positions))))
+            single = self.ov is None or len(positions) == 1
+            for p in positions:
+                sl, top_left = self._tile_region(self._tiles[p], myitem)
+                if all(len(range(s.start, s.stop, s.step)) for s in sl):
+                    plans.setdefault(p, []).append(
+                        (r, sl, top_left, single))
+
+        # requests of the same tile are read together only when their
+        # frames overlap or are adjacent, so that sparse regions do not
+        # decode the frames in between
+        groups = [(p, group) for p in sorted(plans)
+                  for group in _group_by_frames(plans[p])]
+
+        def load(p_group):
+            p, group = p_group
+            # coarsest grid along each axis including the slices of all the
+            # regions in the group
+            read = []
+            for a in range(len(self.shape)):
+                slices = [plan[1][a] for plan in group]
+                start = min(s.start for s in slices)
+                stop = max(range(s.start, s.stop, s.step)[-1]
+                           for s in slices) + 1
+                step = math.gcd(*[s.step for s in slices],
+                                *[s.start - start for s in slices])
+                read.append(slice(start, stop, step))
+
+            index = self._tiles[p].Index
+            logger.info('loading {}\t{}'.format(index, read))
+            with self._pool.get(os.path.join(self.path, index)) as f:
+                f.squeeze_enabled = False
+                return read, np.asarray(f[tuple(read)])
+
+        # tiles are fused in the same order as in _fuse()
+        n_of_workers = max(1, min(self.n_of_threads, len(groups)))
+        with ThreadPoolExecutor(max_workers=n_of_workers) as executor:
+            for (p, group), (read, a) in zip(groups,
+                                             executor.map(load, groups)):
+                index = self._tiles[p].Index
+                for r, sl, top_left, single in group:
+                    sub = tuple(
+                        slice((s.start - rd.start) // rd.step,
+                              (s.stop - rd.start - 1) // rd.step + 1,
+                              s.step // rd.step) for s, rd in zip(sl, read))
+                    # fuse_tile() modifies the slice in place in debug mode
+                    sl_a = a[sub].astype(fused[r].dtype, copy=self._debug)
+
+                    overlaps = None if single else self._tile_overlaps(
+                        index, sl)
+
+                    fuse_tile(fused[r], sl_a, index, sl[0].start, tuple(sl),
+                              top_left, overlaps,
+                              frame_shape=self.temp_shape[-2::],
+                              debug=self._debug)
+
+        return [to_dtype(f, self.dtype) for f in fused]
+
+
+def _group_by_frames(plans):
+    """Split the read plans of a tile (see
+    :meth:`VirtualFusedVolume._fuse_many`) in groups whose ranges of frames
+    overlap or are adjacent.
+
+    Returns
+    -------
+    list
+        A list of lists of plans, sorted by first frame.
+    """
+    groups = []  # [stop, plans]
+    for plan in sorted(plans, key=lambda plan: plan[1][0].start):
+        z = plan[1][0]
+        stop = range(z.start, z.stop, z.step)[-1] + 1
+        if groups and z.start <= groups[-1][0]:
+            groups[-1][0] = max(groups[-1][0], stop)
+            groups[-1][1].append(plan)
+        else:
+            groups.append([stop, [plan]])
+    return [plans for _, plans in groups]
 
-        q.put(None)  # close queue
 
-        t.join()  # wait for fuse thread to finish
+def _check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise CancelledError()
 
-        fused = to_dtype(fused, self.dtype)
 
-        ie = [slice(None, None, flip) for flip in flip_axis]
-        fused = fused[ie]
+class _PendingQuery(object):
+    """A query of :meth:`VirtualFusedVolume.get_region` running on an
+    executor, shared by `waiters` coroutines."""
+    def __init__(self, future, cancel_event):
+        self.future = future
+        self.waiters = 0
+        self._cancel_event = cancel_event
 
-        if self.squeeze_enabled:
-            return np.squeeze(fused)
-        return fused
+    def cancel(self):
+        """Cancel the future and stop the computation, if running."""
+        self.future.cancel()
+        self._cancel_event.set()
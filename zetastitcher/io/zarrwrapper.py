@@ -0,0 +1,155 @@
+import os.path
+
+import numpy as np
+import zarr
+
+from .utils import reduce_channels
+
+
+class ZarrWrapper(object):
+    """Wrapper for chunked array stores in Zarr directory layout.
+
+    The stored array must have shape (`nfrms`, `ysize`, `xsize`) or
+    (`nfrms`, `ysize`, `xsize`, `nchannels`). Arbitrary (Z, Y, X) sub-blocks
+    can be read through :meth:`__getitem__`, touching only the chunks that
+    intersect the requested region.
+    """
+    def __init__(self, file_name=None):
+        self.file_name = file_name
+
+        self.array = None
+
+        self.channel = -1
+        """Channel selected by :meth:`zslice` and :meth:`__getitem__` (-1:
+        all channels, -2: sum of all channels)."""
+
+        if file_name is not None:
+            self.open()
+
+    @property
+    def nfrms(self):
+        return self.array.shape[0]
+
+    @property
+    def ysize(self):
+        return self.array.shape[1]
+
+    @property
+    def xsize(self):
+        return self.array.shape[2]
+
+    @property
+    def nchannels(self):
+        if self.array.ndim > 3:
+            return self.array.shape[3]
+        return 1
+
+    @property
+    def dtype(self):
+        return np.dtype(self.array.dtype)
+
+    @property
+    def shape(self):
+        if self.nchannels > 1:
+            return self.nfrms, self.nchannels, self.ysize, self.xsize
+        else:
+            return self.nfrms, self.ysize, self.xsize
+
+    def open(self, file_name=None):
+        if file_name is not None:
+            self.file_name = file_name
+
+        is_zarr = False
+        for meta in ['.zarray', 'zarr.json']:
+            if os.path.isfile(os.path.join(self.file_name, meta)):
+                is_zarr = True
+                break
+        if not is_zarr:
+            raise ValueError('Unrecognized format for ZarrWrapper')
+
+        self.array = zarr.open_array(self.file_name, mode='r')
+
+        if self.array.ndim not in [3, 4]:
+            raise ValueError('Invalid number of dimensions: {}'.format(
+                self.array.ndim))
+
+    def _channel_index(self):
+        """Index along the channel axis and channel to be passed to
+        :func:`reduce_channels` after reading."""
+        if self.nchannels == 1:
+            return (), -1
+        if self.channel in [-1, -2]:
+            return (slice(None),), self.channel
+        return (slice(self.channel, self.channel + 1),), 0
+
+    def zslice(self, start_frame, end_frame=None, dtype=None, copy=True):
+        if end_frame is None:
+            end_frame = start_frame + 1
+
+        c_index, channel = self._channel_index()
+        a = self.array[(slice(start_frame, end_frame), slice(None),
+                        slice(None)) + c_index]
+
+        return reduce_channels(a, channel, dtype)
+
+    def __getitem__(self, item):
+        """Read a sub-block, with numpy indexing semantics.
+
+        Axis order is the same as in :attr:`shape`, i.e. ZCYX where the C
+        axis is present only if there are multiple channels and no
+        :attr:`channel` is selected.
+        """
+        item = list(np.index_exp[item])
+
+        shape = list(self.shape)
+        if self.nchannels > 1 and self.channel != -1:
+            del shape[1]
+
+        if Ellipsis in item:
+            i = item.index(Ellipsis)
+            item[i:i + 1] = [slice(None)] * (len(shape) - len(item) + 1)
+        if len(item) > len(shape):
+            raise IndexError('Too many indices for array')
+        item += [slice(None)] * (len(shape) - len(item))
+
+        # use only slices with positive steps when reading from the store,
+        # flip and squeeze afterwards
+        zitem = []
+        flip = []
+        squeeze = []
+        for axis, (it, n) in enumerate(zip(item, shape)):
+            if isinstance(it, slice):
+                r = range(*it.indices(n))
+                if r.step < 0:
+                    if len(r):
+                        it = slice(r[-1], r[0] + 1, -r.step)
+                    else:
+                        it = slice(0, 0)
+                    flip.append(axis)
+                zitem.append(it)
+            else:
+                it = int(it)
+                if it < 0:
+                    it += n
+                if not 0 <= it < n:
+                    raise IndexError('Index {} out of bounds for axis {} with '
+                                     'size {}'.format(it, axis, n))
+                zitem.append(slice(it, it + 1))
+                squeeze.append(axis)
+
+        c_index, channel = self._channel_index()
+        if self.nchannels > 1 and self.channel == -1:
+            # move C axis from second to last position (as stored)
+            c_index = (zitem.pop(1),)
+
+        a = self.array[tuple(zitem) + c_index]
+        a = reduce_channels(a, channel)
+
+        if self.nchannels > 1 and self.channel == -1:
+            a = np.moveaxis(a, -1, 1)
+
+        if flip:
+            a = a[tuple(slice(None, None, -1) if i in flip else slice(None)
+                        for i in range(a.ndim))]
+
+        return np.squeeze(a, axis=tuple(squeeze)) if squeeze else a
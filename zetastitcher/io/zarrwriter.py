@@ -0,0 +1,160 @@
+"""Write a fused volume to a chunked, multiscale Zarr directory store."""
+
+import os.path
+
+import numpy as np
+import zarr
+
+
+def downsample(a, dtype):
+    """Downsample a (Z, Y, X[, C]) array by a factor of 2 along Z, Y and X.
+
+    Each output voxel is the mean of a 2x2x2 block. Odd-sized axes are
+    padded by replicating the last plane.
+
+    Parameters
+    ----------
+    a : :class:`numpy.ndarray`
+    dtype
+        Output dtype.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+    """
+    pad = [(0, s % 2) for s in a.shape[:3]] + [(0, 0)] * (a.ndim - 3)
+    if any(p[1] for p in pad):
+        a = np.pad(a, pad, mode='edge')
+
+    z, y, x = a.shape[:3]
+    a = a.reshape((z // 2, 2, y // 2, 2, x // 2, 2) + a.shape[3:])
+    a = a.mean(axis=(1, 3, 5), dtype=np.float32)
+
+    if np.issubdtype(dtype, np.integer):
+        np.rint(a, a)
+    return a.astype(dtype, copy=False)
+
+
+class ZarrPyramidWriter(object):
+    """Write a volume to a Zarr store, building a multiscale pyramid.
+
+    The full resolution volume is appended slab by slab along Z with
+    :meth:`write`. Each slab is also downsampled on the fly to fill all
+    lower resolution levels, so that the pyramid is complete once
+    :meth:`close` is called.
+
+    Level `i` is stored in array `i` within the store, and is downsampled
+    by a factor of ``2 ** i`` along Z, Y and X. Axis order is ZYX, with a
+    trailing C axis for multichannel volumes (the same layout read by
+    :class:`~zetastitcher.io.zarrwrapper.ZarrWrapper`). Multiscale metadata
+    are stored in the group attributes following the OME-Zarr layout. Since
+    OME-Zarr requires the C axis before the spatial ones, multichannel
+    stores do not declare an OME-Zarr version nor axes.
+    """
+    def __init__(self, path, shape, dtype, levels=4, chunks=(64, 256, 256),
+                 full_resolution=True):
+        """
+        Parameters
+        ----------
+        path : str
+            Path of the output directory store. Existing data is overwritten.
+        shape : tuple
+            Shape of the full resolution volume: (Z, Y, X[, C]).
+        dtype
+            Data type of the volume.
+        levels : int
+            Number of resolution levels, including full resolution.
+        chunks : tuple
+            Chunk size along (Z, Y, X).
+        full_resolution : bool
+            Whether to store the full resolution level. If `False`, slabs
+            passed to :meth:`write` are only used to compute the lower
+            resolution levels.
+        """
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+        self.arrays = []
+        self._z = []  # next plane to be written, for each level
+        self._carry = []  # planes waiting to be downsampled, for each level
+
+        root = zarr.open_group(path, mode='w')
+
+        datasets = []
+        level_shape = self.shape
+        for i in range(0, levels):
+            self._z.append(0)
+            self._carry.append(None)
+
+            if i == 0 and not full_resolution:
+                self.arrays.append(None)
+            else:
+                level_chunks = tuple(min(c, s) for c, s in
+                                     zip(chunks, level_shape[:3]))
+                level_chunks += tuple(level_shape[3:])
+
+                self.arrays.append(zarr.open_array(
+                    os.path.join(path, str(i)), mode='w', shape=level_shape,
+                    chunks=level_chunks, dtype=self.dtype))
+
+                scale = [2 ** i] * 3 + [1] * (len(self.shape) - 3)
+                datasets.append({
+                    'path': str(i),
+                    'coordinateTransformations': [
+                        {'type': 'scale', 'scale': scale}
+                    ]
+                })
+
+            level_shape = tuple((s + 1) // 2 for s in level_shape[:3]) \
+                + level_shape[3:]
+
+        multiscale = {
+            'name': os.path.basename(os.path.normpath(path)),
+            'datasets': datasets,
+            'type': 'mean',
+        }
+        if len(self.shape) == 3:
+            multiscale['version'] = '0.4'
+            multiscale['axes'] = [{'name': n, 'type': 'space'}
+                                  for n in ['z', 'y', 'x']]
+
+        root.attrs['multiscales'] = [multiscale]
+
+    def write(self, a):
+        """Append a slab of frames to the full resolution level.
+
+        Parameters
+        ----------
+        a : :class:`numpy.ndarray`
+            Array of shape (Z, Y, X[, C]), where (Y, X[, C]) match
+            :attr:`shape`.
+        """
+        self._write_level(0, a)
+
+    def _write_level(self, level, a):
+        z = self._z[level]
+        if self.arrays[level] is not None:
+            self.arrays[level][z:z + a.shape[0]] = a
+        self._z[level] += a.shape[0]
+
+        if level + 1 == len(self.arrays):
+            return
+
+        carry = self._carry[level]
+        if carry is not None:
+            a = np.concatenate([carry, a])
+
+        n = a.shape[0] // 2 * 2
+        self._carry[level] = np.copy(a[n:]) if n < a.shape[0] else None
+
+        if n:
+            self._write_level(level + 1, downsample(a[:n], self.dtype))
+
+    def close(self):
+        """Downsample the remaining planes, if any, completing the pyramid."""
+        for level in range(0, len(self.arrays) - 1):
+            carry = self._carry[level]
+            self._carry[level] = None
+            if carry is not None:
+                self._write_level(level + 1, downsample(carry, self.dtype))
@@ -1,8 +1,28 @@
 import os.path
 import zipfile
 
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import imageio
 
+from .utils import reduce_channels, reduced_dtype, reduced_shape
+
+
+IMAGE_EXTENSIONS = ['.bmp', '.gif', '.jp2', '.jpeg', '.jpg', '.png', '.tif',
+                    '.tiff']
+"""Extensions of the archive members that are read as frames."""
+
+
+def is_frame(info):
+    """Whether archive member `info` (a :class:`zipfile.ZipInfo`) is a
+    frame, i.e. an image file that is neither hidden nor macOS metadata."""
+    name = info.filename
+    base = name.rsplit('/', 1)[-1]
+    if info.is_dir() or base.startswith('.') or name.startswith('__MACOSX/'):
+        return False
+    return os.path.splitext(base)[1].lower() in IMAGE_EXTENSIONS
+
 
 class ZipWrapper(object):
     def __init__(self, file_name=None):
@@ -16,6 +36,17 @@ class ZipWrapper(object):
         self.dtype = None
         self.nchannels = 1
 
+        self.channel = -1
+        """Channel selected by :meth:`zslice` (-1: all channels, -2: sum of
+        all channels)."""
+
+        self.n_of_threads = 1
+        """Number of threads used to decode frames concurrently in
+        :meth:`zslice`."""
+
+        self._members = None
+        self._frame_shape = None
+
         self.open()
 
     @property
@@ -30,9 +61,18 @@ class ZipWrapper(object):
             self.file_name = file_name
 
         self.zf = zipfile.ZipFile(self.file_name, mode='r')
-        names = self.zf.namelist()
 
-        im = imageio.imread(self.zf.read(names[0]))
+        # index of frames, sorted by name: frame i is read directly from its
+        # ZipInfo (holding the member offset)
+        self._members = sorted(filter(is_frame, self.zf.infolist()),
+                               key=lambda i: i.filename)
+        if not self._members:
+            self.zf.close()
+            raise zipfile.BadZipFile('No image files found in {}'.format(
+                self.file_name))
+        names = [i.filename for i in self._members]
+
+        im = imageio.imread(self.zf.read(self._members[0]))
 
         self.xsize = im.shape[-1]
         self.ysize = im.shape[-2]
@@ -40,12 +80,36 @@ class ZipWrapper(object):
         self.dtype = im.dtype
         if len(im.shape) > 2:
             self.nchannels = im.shape[0]
+        self._frame_shape = im.shape
         fname, ext = os.path.splitext(names[0])
         self.file_name_fmt = '{:0' + str(len(fname)) + '}' + ext
 
+    def close(self):
+        self.zf.close()
+
     def frame(self, index, dtype=None, copy=None):
-        a = imageio.imread(self.zf.read(self.file_name_fmt.format(index)))
+        a = imageio.imread(self.zf.read(self._members[index]))
 
         if dtype is not None:
             a = a.astype(dtype)
         return a
+
+    def zslice(self, start_frame, end_frame=None, dtype=None, copy=True):
+        if end_frame is None:
+            end_frame = start_frame + 1
+
+        a = np.empty(
+            (end_frame - start_frame,)
+            + reduced_shape(self._frame_shape, self.channel),
+            dtype=reduced_dtype(self.dtype, self.channel, dtype))
+
+        def read(i):
+            im = imageio.imread(self.zf.read(self._members[i]))
+            reduce_channels(im, self.channel, dtype, out=a[i - start_frame])
+
+        n_of_threads = max(1, min(self.n_of_threads, a.shape[0]))
+        with ThreadPoolExecutor(max_workers=n_of_threads) as executor:
+            # consume results so that exceptions are propagated
+            list(executor.map(read, range(start_frame, end_frame)))
+
+        return a
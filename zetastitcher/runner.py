@@ -177,7 +177,8 @@ class Runner(object):
 
     def initialize_queue(self):
         fm = FileMatrix(self.input_folder, self.ascending_tiles_x,
-                        self.ascending_tiles_y, recursive=self.recursive)
+                        self.ascending_tiles_y, recursive=self.recursive,
+                        n_of_threads=self.n_of_threads)
         self.fm = fm
 
         stitch_X = {